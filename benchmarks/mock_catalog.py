@@ -0,0 +1,157 @@
+# A local stand-in for the NCSU catalog, so order_pull_lists.py can be benchmarked without the network. It answers the three kinds of requests the script makes:
+#   /?search_field=all_fields&q=<isbn>       the HTML search results page (the top result's link is what parse_catkey looks for)
+#   /catalog.json?...&q=<isbn> OR <isbn>     the JSON search results, in the JSON:API style Blacklight uses
+#   /catalog/NCSU<catkey>.json               an item record
+# Which ISBNs are in the catalog comes from synthetic.catalog_has_isbn. Every response can be delayed (latency_ms, plus up to jitter_ms at random),
+# and a share of the requests (error_rate) fail with a 503, so retries and the adaptive limiter get exercised too.
+# Records of missing_catkeys answer 404, like a record that was withdrawn after the catalog export the offline index was built from.
+# JSON searches return at most per_page records (and never more than max_per_page, if it's set, like a catalog that caps its page size),
+# with the total number of matches in meta.pages.total_count.
+#
+# Recorded responses can be dropped into a fixtures folder to serve real-looking pages: search.html (with {catkey} where the catkey goes), no_results.html,
+# and record.json (with "{catkey}", "{isbn}" and "{title}" placeholders). Anything not in the folder uses the small built-in versions below.
+#
+# Run it on its own with:  python -m benchmarks.mock_catalog --port 8765 --latency-ms 50 --error-rate 0.01
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import catalog_has_isbn, catkey_for_isbn
+
+SEARCH_HTML = '''<html><body><div id="documents">
+<article class="document document-position-1"><h3 class="index_title"><a data-context-href="/catalog/NCSU{catkey}/track?counter=1" href="/catalog/NCSU{catkey}">Synthetic Title</a></h3></article>
+</div></body></html>'''
+NO_RESULTS_HTML = '''<html><body><div id="documents"><h2>No results found for your search</h2></div></body></html>'''
+RECORD_JSON = json.dumps({
+    "title": "{title}", "statement_of_responsibility": "Synthetic Author", "isbn": ["{isbn}"], "edition": "2nd ed.", "publication_year": "2020",
+    "call_number": "QA76.73 .P98 2020", "type": ["Book"], "access_restrictions": "",
+    "locations": [{"library": {"display": "D. H. Hill Jr. Library"}, "location": {"display": "Textbook Collection"}}],
+    "items": [{"item_id": "S02{catkey}1", "loc": "TEXTBOOK"}, {"item_id": "S02{catkey}2", "loc": "TEXTBOOK"}],
+})
+
+
+class MockCatalog:
+    def __init__(self, port=0, latency_ms=0, jitter_ms=0, error_rate=0.0, found_percent=60, fixtures_dir=None, seed=0, missing_catkeys=(),
+                 max_per_page=None):
+        self.latency_ms = latency_ms
+        self.max_per_page = max_per_page
+        self.missing_catkeys = set(missing_catkeys)
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.found_percent = found_percent
+        self.templates = {"search.html": SEARCH_HTML, "no_results.html": NO_RESULTS_HTML, "record.json": RECORD_JSON}
+        if fixtures_dir is not None:
+            for name in self.templates:
+                if os.path.exists(os.path.join(fixtures_dir, name)):
+                    with open(os.path.join(fixtures_dir, name), encoding="utf-8") as f:
+                        self.templates[name] = f.read()
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:" + str(self.server.server_address[1]) + "/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # How long to wait before answering, and whether this request should fail.
+    def _draw(self):
+        with self._lock:
+            self.requests += 1
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            fail = self._random.random() < self.error_rate
+        return delay, fail
+
+    def respond(self, path):
+        url = urlparse(path)
+        query = parse_qs(url.query)
+        if url.path.startswith("/catalog/NCSU") and url.path.endswith(".json"):
+            catkey = url.path[len("/catalog/NCSU"):-len(".json")]
+            if catkey in self.missing_catkeys:
+                return 404, "text/plain", "Not found"
+            body = self.templates["record.json"].replace("{catkey}", catkey).replace("{isbn}", "979" + catkey.zfill(9)).replace("{title}", "Synthetic Title " + catkey)
+            return 200, "application/json", body
+        if url.path == "/catalog.json":
+            isbns = query.get("q", [""])[0].split(" OR ")
+            docs = [{"id": "NCSU" + catkey_for_isbn(isbn), "type": "document", "attributes": {"isbn_ssim": {"attributes": {"value": [isbn]}}}}
+                    for isbn in isbns if catalog_has_isbn(isbn, self.found_percent)]
+            per_page = int(query.get("per_page", ["10"])[0])
+            if self.max_per_page is not None:
+                per_page = min(per_page, self.max_per_page)
+            return 200, "application/json", json.dumps({"data": docs[:per_page], "meta": {"pages": {"total_count": len(docs), "limit_value": per_page}}})
+        if url.path == "/":
+            isbn = query.get("q", [""])[0]
+            if catalog_has_isbn(isbn, self.found_percent):
+                return 200, "text/html", self.templates["search.html"].replace("{catkey}", catkey_for_isbn(isbn))
+            return 200, "text/html", self.templates["no_results.html"]
+        return 404, "text/plain", "Not found"
+
+    def _handler(self):
+        catalog = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real catalog, so the client's connection reuse is part of what's measured.
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                delay, fail = catalog._draw()
+                time.sleep(delay)
+                if fail:
+                    status, content_type, body = 503, "text/plain", "Service unavailable"
+                else:
+                    status, content_type, body = catalog.respond(self.path)
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                if status == 503:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a mock NCSU catalog for benchmarking.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--found-percent", type=int, default=60)
+    parser.add_argument("--fixtures", default=None, help="Folder with recorded search.html / no_results.html / record.json responses.")
+    parser.add_argument("--max-per-page", type=int, default=None, help="Cap the number of records a JSON search returns.")
+    args = parser.parse_args()
+    catalog = MockCatalog(args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.found_percent, args.fixtures, max_per_page=args.max_per_page)
+    print("Mock catalog running at " + catalog.url + " (Ctrl+C to stop)")
+    try:
+        catalog.server.serve_forever()
+    except KeyboardInterrupt:
+        catalog.stop()
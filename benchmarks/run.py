@@ -0,0 +1,163 @@
+# Benchmarks order_pull_lists.py end to end, without the G:/ drive or the live catalog. For each bookstore list size, it:
+#   1. generates a synthetic Textbooks folder (see synthetic.py),
+#   2. starts the mock catalog (see mock_catalog.py) with the latency and error rate asked for,
+#   3. runs the script on it, once with an empty catalog cache ("cold") and once more with the cache it left behind ("warm"),
+#   4. reads the run report the script saves (see metrics.py), and prints the end-to-end and per-stage throughput.
+#
+# Run it from the repository folder, for example:
+#   python -m benchmarks.run                                        1k, 10k and 100k rows, 20 ms catalog latency
+#   python -m benchmarks.run --rows 10000 --concurrency 4 8 16      compare concurrency settings
+#   python -m benchmarks.run --output before.json                   save the results...
+#   python -m benchmarks.run --baseline before.json                 ...and later flag anything that got more than 20% slower (exits with status 1)
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_catalog import MockCatalog
+from benchmarks.synthetic import BOOKSTORE_LIST, SEMESTER, build_textbooks_dir
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOOKSTORE_LIST_DATE = BOOKSTORE_LIST.split(" ", 1)[1]
+
+
+# Generate the Textbooks folder for one size, or reuse it if an earlier benchmark already generated it in workdir.
+def prepare(workdir, rows, seed):
+    root = os.path.join(workdir, str(rows) + "-rows")
+    info_path = os.path.join(root, "synthetic.json")
+    if os.path.exists(info_path):
+        with open(info_path) as f:
+            return root, json.load(f)
+    started = time.perf_counter()
+    info = build_textbooks_dir(root, rows, seed)
+    info["generate_seconds"] = round(time.perf_counter() - started, 3)
+    with open(info_path, "w") as f:
+        json.dump(info, f)
+    return root, info
+
+
+# Removes what a run writes into the semester folder, so the next run starts from the same state (otherwise the snapshot would turn on
+# the delta mode prompt, and a leftover checkpoint would turn the run into a resume).
+def clean_outputs(root):
+    sem_dir = os.path.join(root, "semesters", SEMESTER)
+    for pattern in ["order_list " + BOOKSTORE_LIST_DATE + "*", "pull_list " + BOOKSTORE_LIST_DATE + "*", "run_report *", "bookstore_snapshot *", "search_checkpoint *"]:
+        for path in glob.glob(os.path.join(sem_dir, pattern)):
+            os.remove(path)
+
+
+def clear_cache(root):
+    for path in glob.glob(os.path.join(root, "catalog_cache.sqlite*")):
+        os.remove(path)
+
+
+# Runs order_pull_lists.py once (in its own process, like staff run it), and returns its run report with the measured wall time added.
+def run_script(root, catalog_url, concurrency):
+    clean_outputs(root)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, "order_pull_lists.py"), SEMESTER, BOOKSTORE_LIST, "--root", root,
+                             "--catalog-url", catalog_url, "--max-searches", str(concurrency)], cwd=REPO_DIR, capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit("order_pull_lists.py failed:\n" + result.stdout[-2000:] + result.stderr[-4000:])
+    with open(os.path.join(root, "semesters", SEMESTER, "run_report " + BOOKSTORE_LIST_DATE + ".json")) as f:
+        report = json.load(f)
+    report["wall_seconds"] = round(wall_seconds, 3)
+    return report
+
+
+def summarize(rows, concurrency, cache_state, report):
+    wall = report["wall_seconds"]
+    summary = {
+        "rows": rows, "concurrency": concurrency, "cache": cache_state, "wall_seconds": wall,
+        "rows_per_second": round(rows / wall, 1), "isbns_per_second": round(report["isbns_searched"] / wall, 1),
+        "isbns_searched": report["isbns_searched"], "items_found": report["items_found"], "stages": report["stages"],
+    }
+    for kind, stats in report.get("requests", {}).items():
+        summary[kind] = {"count": stats["count"], "retries": stats["retries"], "p50_ms": stats["latency_ms"]["p50"],
+                         "p95_ms": stats["latency_ms"]["p95"], "requests_per_second": stats["requests_per_second"]}
+    return summary
+
+
+def print_summary(summary):
+    line = (str(summary["rows"]).rjust(7) + " rows  " + summary["cache"].ljust(4) + "  x" + str(summary["concurrency"]).ljust(3)
+            + str(summary["wall_seconds"]).rjust(9) + "s  " + str(summary["rows_per_second"]).rjust(9) + " rows/s  "
+            + str(summary["isbns_per_second"]).rjust(8) + " ISBNs/s")
+    for kind in ("searches", "records"):
+        if kind in summary:
+            line += ("  " + kind + ": " + str(summary[kind]["count"]) + " req, p50 " + str(summary[kind]["p50_ms"]) + "ms, p95 "
+                     + str(summary[kind]["p95_ms"]) + "ms, " + str(summary[kind]["retries"]) + " retries")
+    print(line)
+    print("        " + ", ".join(stage + " " + str(seconds) + "s" for stage, seconds in summary["stages"].items()))
+
+
+# Compares wall times with an earlier --output file. Returns the results that got slower by more than tolerance.
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {(r["rows"], r["concurrency"], r["cache"]): r for r in json.load(f)["results"]}
+    regressions = []
+    print("\nCompared with " + baseline_path + ":")
+    for result in results:
+        before = baseline.get((result["rows"], result["concurrency"], result["cache"]))
+        if before is None:
+            continue
+        change = result["wall_seconds"] / before["wall_seconds"] - 1
+        flag = "  <-- slower" if change > tolerance else ""
+        print("    " + str(result["rows"]).rjust(7) + " rows  " + result["cache"].ljust(4) + "  x" + str(result["concurrency"]).ljust(3)
+              + str(before["wall_seconds"]).rjust(9) + "s -> " + str(result["wall_seconds"]) + "s (" + format(change, "+.0%") + ")" + flag)
+        if flag:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark order_pull_lists.py on synthetic bookstore lists against a mock catalog.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000], help="Bookstore list sizes (rows) to benchmark.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8], help="max_catalog_searches values to try.")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mock catalog response time.")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Random extra response time, up to this much.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of catalog requests that fail with a 503.")
+    parser.add_argument("--found-percent", type=int, default=60, help="Percent of ISBNs the mock catalog has.")
+    parser.add_argument("--fixtures", default=None, help="Folder with recorded catalog responses (see mock_catalog.py).")
+    parser.add_argument("--no-warm", action="store_true", help="Skip the second run with a warm catalog cache.")
+    parser.add_argument("--workdir", default=None, help="Where to generate the synthetic data (kept and reused). Defaults to a temporary folder.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Save the results as JSON.")
+    parser.add_argument("--baseline", default=None, help="Earlier --output file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="How much slower than the baseline counts as a regression.")
+    args = parser.parse_args(argv)
+
+    temp = None
+    if args.workdir is None:
+        temp = tempfile.TemporaryDirectory(prefix="textbooks-benchmark-")
+        args.workdir = temp.name
+    results = []
+    with MockCatalog(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, found_percent=args.found_percent,
+                     fixtures_dir=args.fixtures, seed=args.seed) as catalog:
+        for rows in args.rows:
+            root, info = prepare(args.workdir, rows, args.seed)
+            print("\n" + str(info["rows"]) + " rows, " + str(info["titles"]) + " titles (" + root + ")")
+            for concurrency in args.concurrency:
+                clear_cache(root)
+                for cache_state in ["cold"] if args.no_warm else ["cold", "warm"]:
+                    summary = summarize(info["rows"], concurrency, cache_state, run_script(root, catalog.url, concurrency))
+                    print_summary(summary)
+                    results.append(summary)
+    if temp is not None:
+        temp.cleanup()
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+        print("\nResults saved to " + args.output)
+    if args.baseline is not None and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Generates a synthetic Textbooks folder to benchmark order_pull_lists.py with: a "formatted for DB processing" bookstore list, SpecialTitles,
+# and earlier order/pull lists for the semester, laid out exactly like the folder on the G:/ drive.
+# Everything is generated from a seed, so the same size always gives the same workbooks.
+#
+# Whether the mock catalog (see mock_catalog.py) has an ISBN, and the catkey it has it under, are worked out from the ISBN itself (catalog_has_isbn and
+# catkey_for_isbn), so the generator and the mock catalog agree without sharing any files.
+
+import os
+import random
+
+import pandas as pd
+
+from isbns import isbn13_check_digit
+
+SEMESTER = "Fall 2023"
+BOOKSTORE_LIST = "FallBookstoreList 9-8-2023"
+
+DEPARTMENTS = ["BIO", "CH", "CSC", "E", "ECE", "ENG", "HI", "MA", "MAE", "PY", "PSY", "ST"]
+BINDINGS = ["PB", "HC", "LL", "DIGITAL"]
+
+
+# The index-th synthetic ISBN-13, as a string. Every index gives a different, valid ISBN.
+def synthetic_isbn(index):
+    first_twelve = "979" + str(100000000 + index)
+    return first_twelve + isbn13_check_digit(first_twelve)
+
+
+# About found_percent percent of ISBNs are in the catalog. The choice is spread over the ISBNs with a multiplicative hash, so it doesn't follow the list order.
+def catalog_has_isbn(isbn, found_percent=60):
+    digits = isbn[3:12]
+    return digits.isdigit() and (int(digits) * 2654435761) % 100 < found_percent
+
+
+def catkey_for_isbn(isbn):
+    return isbn[3:12].lstrip("0") or "0"
+
+
+# Writes the whole Textbooks folder for a bookstore list of about `rows` rows (one row per course section) into root. Returns a dict describing what was written.
+def build_textbooks_dir(root, rows, seed=0):
+    rng = random.Random(seed)
+    sem_dir = os.path.join(root, "semesters", SEMESTER)
+    os.makedirs(sem_dir, exist_ok=True)
+
+    # Each title is used by one to four sections, so there are roughly half as many ISBNs as rows. A few rows have a blank ISBN, like on the real lists.
+    records = []
+    title = 0
+    while len(records) < rows:
+        isbn = synthetic_isbn(title)
+        dept = rng.choice(DEPARTMENTS)
+        course = rng.randrange(100, 600)
+        author = "Author " + str(rng.randrange(rows))
+        binding = rng.choice(BINDINGS)
+        edition = str(rng.randrange(1, 12))
+        for section in range(1, rng.randint(1, 4) + 1):
+            records.append({
+                'Term': 'F23', 'Dept': dept, 'Crs': course, 'Sect': str(section).zfill(3), 'Est Enr': rng.randrange(10, 300),
+                'Stat': 'R', 'Author': author, 'Binding': binding, 'Title': "Synthetic Title " + str(title),
+                'ISBN-13': "" if rng.random() < 0.005 else int(isbn), 'ISBN-10': '', 'Edition': edition, 'Last Used': '', 'List_New': 99.99,
+                'Net_New': 75.0, 'List_Used': 74.99, 'Net_Used': 56.25, 'Copyright': 2020, 'Date': '9/8/2023', 'Instructor': 'Instructor ' + str(title % 500),
+            })
+        title += 1
+    records = records[:rows]
+    isbns = [synthetic_isbn(index) for index in range(title)]
+
+    bookstore_df = pd.DataFrame(records)
+    with pd.ExcelWriter(os.path.join(sem_dir, BOOKSTORE_LIST + ".xlsx"), engine='xlsxwriter') as writer:
+        # The real bookstore lists also have the raw data on another sheet, which the script never reads.
+        bookstore_df.head(100).to_excel(writer, sheet_name='raw', index=False)
+        bookstore_df.to_excel(writer, sheet_name='formatted for DB processing', index=False)
+
+    # SpecialTitles: about 2% of the titles have a replacement (a few of them chained), and 1% are excluded. It's read with dtype=str, so ISBNs are saved as text.
+    sample = rng.sample(isbns, max(3, len(isbns) * 3 // 100))
+    replaced, excluded = sample[:len(sample) * 2 // 3], sample[len(sample) * 2 // 3:]
+    replacements = [synthetic_isbn(title + index) for index in range(len(replaced))]
+    # Some replacements have been replaced again since, which the script follows through to the last one.
+    chained = list(zip(replacements[:len(replacements) // 10], [synthetic_isbn(2 * title + index) for index in range(len(replacements) // 10)]))
+    with pd.ExcelWriter(os.path.join(root, "SpecialTitles.xlsx"), engine='xlsxwriter') as writer:
+        pd.DataFrame({'Bookstore ISBN': replaced + [isbn for isbn, _ in chained], 'Catalog ISBN': replacements + [isbn for _, isbn in chained],
+                      'Notes': ''}).to_excel(writer, sheet_name='replace', index=False)
+        pd.DataFrame({'Bookstore ISBN': excluded, 'Notes': ''}).to_excel(writer, sheet_name='exclude', index=False)
+
+    # Earlier order and pull lists for the semester, each with about 5% of the titles.
+    earlier = rng.sample(isbns, max(2, len(isbns) // 10))
+    previously_ordered, previously_pulled = earlier[:len(earlier) // 2], earlier[len(earlier) // 2:]
+    with pd.ExcelWriter(os.path.join(sem_dir, "order_list 8-25-2023.xlsx"), engine='xlsxwriter') as writer:
+        pd.DataFrame({'Term': 'F23', 'ISBN-13': previously_ordered}).to_excel(writer, sheet_name='Order List', index=False)
+    with pd.ExcelWriter(os.path.join(sem_dir, "pull_list 8-25-2023.xlsx"), engine='xlsxwriter') as writer:
+        pd.DataFrame({'Catkey': [catkey_for_isbn(isbn) for isbn in previously_pulled], 'Bookstore ISBN': previously_pulled}).to_excel(writer, sheet_name='Pull List', index=False)
+
+    return {"semester": SEMESTER, "bookstore_list": BOOKSTORE_LIST, "rows": len(records), "titles": title,
+            "replacements": len(replaced) + len(chained), "exclusions": len(excluded), "previous_titles": len(earlier)}
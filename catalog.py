@@ -0,0 +1,413 @@
+# This module handles all of the communication with the NCSU catalog for the order/pull list script.
+# Searching the catalog one ISBN at a time with a fresh connection for every request is what made the script take ~40 minutes on 1,200 items.
+# Here, every request goes through one shared requests.Session (so keep-alive connections get reused), searches run on a small thread pool,
+# and an adaptive limiter backs off when the catalog starts slowing down or tells us to slow down (429/5xx).
+# If a CatalogCache is passed in (see catalog_cache.py), searches and item records are answered from it whenever possible.
+# If a CatalogIndex is passed in (see catalog_index.py), ISBNs are first looked up in the offline index, and only the misses are searched live.
+# With search_backend="json", live searches send many ISBNs per request as one OR-query to the catalog's JSON search results, and map each returned record's
+# ISBNs back to the ISBNs that were asked for. The original one-ISBN-per-request HTML search ("html") is still used as the fallback.
+# If a RunMetrics is passed in (see metrics.py), the latency, status, size and retries of every request are recorded in it.
+
+import random           # Adds jitter to retry delays so that parallel retries don't all hit the catalog at the same moment.
+import re               # Regular Expressions library used to pull the catkey out of the search results page.
+import threading        # Used by the limiter to coordinate the worker threads.
+import time             # Used to measure request latency and to sleep between retries.
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from catalog_index import clean_catkey
+from isbns import canonical_isbn
+from records import loads   # orjson's faster JSON parser when it's installed, the built-in one otherwise.
+
+CATALOG_URL = "https://catalog.lib.ncsu.edu/"
+
+# Responses with these status codes are worth retrying: the catalog is either rate limiting us or temporarily unavailable.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Limits how many catalog requests can be in flight at once. The limit starts at max_concurrency and adjusts itself as responses come back:
+# if the catalog answers with 429/5xx, or the average response time climbs to slowdown_factor times the best average we've seen, the limit is halved.
+# Once responses are fast again, the limit creeps back up one slot at a time (never above max_concurrency).
+class AdaptiveLimiter:
+    def __init__(self, max_concurrency=8, min_concurrency=1, slowdown_factor=2.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.slowdown_factor = slowdown_factor
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self.avg_latency = None
+        self.baseline_latency = None
+        self._since_change = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    # Called when a request finishes. latency is in seconds; throttled is True when the catalog pushed back (429/5xx or a connection failure).
+    def release(self, latency=None, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self._decrease()
+            elif latency is not None:
+                # Exponentially weighted moving average, so one slow response doesn't change the limit on its own.
+                self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+                if self.baseline_latency is None:
+                    self.baseline_latency = self.avg_latency
+                self._since_change += 1
+                # Only re-evaluate after a full "window" of responses at the current limit.
+                if self._since_change >= self.limit:
+                    if self.avg_latency > self.baseline_latency * self.slowdown_factor:
+                        self._decrease()
+                    else:
+                        # Let the baseline drift up slowly, so a catalog that is just a bit slower today doesn't pin us at the minimum forever.
+                        self.baseline_latency = min(self.avg_latency, self.baseline_latency * 1.05)
+                        if self.limit < self.max_concurrency:
+                            self.limit += 1
+                        self._since_change = 0
+            self._cond.notify_all()
+
+    def _decrease(self):
+        self.limit = max(self.min_concurrency, self.limit // 2)
+        self._since_change = 0
+
+
+# This is what pulls the catkey of the top search result out of the catalog search page. It's the same parsing the script has always used,
+# so a concurrent run finds exactly the same catkeys as a serial one. Returns None if the search had no results.
+def parse_catkey(page_text):
+    if '<a data-context-href="/catalog/' not in page_text:
+        return None
+    catkey = re.findall('catalog/(.*)counter=1', page_text)
+    catkey = re.sub('/track[?]', '', str(catkey))
+    catkey = re.sub('NCSU', '', catkey)
+    catkey = re.sub('[^A-Za-z0-9]', '', str(catkey))
+    return catkey
+
+
+class CatalogClient:
+    def __init__(self, catalog_url=CATALOG_URL, max_concurrency=8, retries=4, backoff=1.0, timeout=30, cache=None, index=None,
+                 search_backend="html", batch_size=25, metrics=None):
+        self.catalog_url = catalog_url
+        self.search_backend = search_backend
+        self.batch_size = max(1, batch_size) if search_backend == "json" else 1
+        self._json_failed = False
+        self.cache = cache
+        self.index = index
+        self.index_hits = 0     # Number of ISBNs resolved from the offline index instead of a live search.
+        self.metrics = metrics
+        self.max_concurrency = max(1, max_concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # One limiter for every request, searches and item record fetches alike, so max_concurrency caps the total load on the catalog
+        # even while searching and fetching overlap (see search_and_fetch_iter), and a slowdown seen by either one backs both off.
+        self.limiter = AdaptiveLimiter(self.max_concurrency)
+        # One session for the whole run. The connection pool is sized to the concurrency cap so every worker thread can keep its own connection alive.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    # GET a URL, retrying with exponential backoff on 429/5xx responses and connection errors.
+    # The last response is returned even if it's still an error, so the caller can decide what to do with it.
+    # kind ("searches" or "records") is only used to group the requests in the run metrics.
+    def get(self, url, headers=None, kind="searches"):
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                r = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self.limiter.release(throttled=True)
+                if self.metrics is not None:
+                    self.metrics.record_request(kind, started, time.perf_counter() - started, retry=attempt < self.retries)
+                if attempt == self.retries:
+                    raise
+                self._wait_before_retry(attempt)
+                continue
+            latency = time.perf_counter() - started
+            throttled = r.status_code in RETRY_STATUSES
+            self.limiter.release(latency, throttled)
+            if self.metrics is not None:
+                self.metrics.record_request(kind, started, latency, r.status_code, len(r.content), retry=throttled and attempt < self.retries)
+            if not throttled or attempt == self.retries:
+                return r
+            self._wait_before_retry(attempt, r.headers.get("Retry-After"))
+
+    def _wait_before_retry(self, attempt, retry_after=None):
+        # If the catalog told us how long to wait, respect that. Otherwise, double the wait each attempt and add some jitter.
+        if retry_after is not None and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            delay = self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+        time.sleep(min(delay, 60))
+
+    # GET a URL through the cache. A fresh cache entry is returned without touching the network, a stale one is revalidated with a conditional GET,
+    # and anything else is downloaded and saved. parse(response) turns a 200 response into the value to cache; it returns None for "not found".
+    # Returns the cached/parsed value, or None.
+    def _cached_get(self, kind, key, url, parse):
+        entry = self.cache.get(kind, key) if self.cache is not None else None
+        if entry is not None and entry.fresh:
+            self.cache.count(kind, "hit")
+            return entry.value
+        r = self.get(url, headers=entry.revalidation_headers() if entry is not None else None, kind=kind)
+        if r.status_code == 304 and entry is not None:
+            self.cache.count(kind, "revalidated")
+            self.cache.touch(kind, key)
+            return entry.value
+        value = parse(r)
+        if self.cache is not None:
+            self.cache.count(kind, "miss")
+            self.cache.put(kind, key, value, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        return value
+
+    # Search the catalog for one ISBN and return the catkey of the top result, or None if there were no results.
+    def search(self, isbn):
+        def parse(r):
+            r.raise_for_status()
+            return parse_catkey(r.text)
+        return self._cached_get("searches", isbn, self.catalog_url + "?search_field=all_fields&q=" + str(isbn), parse)
+
+    # Fetch the JSON record for a catkey. Returns the parsed JSON, or None if the catalog has no record for it (204/404).
+    def fetch_record(self, catkey):
+        def parse(r):
+            if r.status_code in (204, 404):
+                return None
+            r.raise_for_status()
+            return r.text
+        body = self._cached_get("records", catkey, self.catalog_url + "catalog/NCSU" + str(catkey) + ".json", parse)
+        if body is None:
+            return None
+        return loads(body)
+
+    # Resolve as many ISBNs as possible from the offline index, in one vectorized lookup. known holds results we already have (ISBN -> catkey).
+    # Returns known with the index hits added.
+    def _resolve_locally(self, isbns, known=None):
+        known = dict(known or {})
+        if self.index is not None:
+            local = self.index.lookup([isbn for isbn in isbns if isbn not in known])
+            self.index_hits += len(local)
+            known.update(local)
+        return known
+
+    # Search the catalog for a batch of ISBNs with a single request to the JSON search results. Returns (found, complete):
+    # found maps each ISBN that appeared on a returned record to that record's catkey (the highest-ranked record wins, like the top HTML result).
+    # complete is False if the search matched more records than were returned, since then a missing ISBN might just be on the next page.
+    # The catalog may cap per_page lower than what we ask for, so this goes by the total hit count it reports, not by the page size we sent.
+    def _json_search(self, isbns):
+        per_page = len(isbns) * 2
+        query = urlencode({"search_field": "all_fields", "per_page": per_page, "q": " OR ".join(isbns)})
+        r = self.get(self.catalog_url + "catalog.json?" + query)
+        r.raise_for_status()
+        page = loads(r.content)
+        # Blacklight returns either {"data": [...]} (JSON:API style) or {"response": {"docs": [...]}}, depending on its version.
+        docs = page.get("data") if isinstance(page.get("data"), list) else page.get("response", {}).get("docs", [])
+        wanted = set(isbns)
+        found = {}
+        for doc in docs:
+            catkey = clean_catkey(doc.get("id", ""))
+            for isbn in _record_isbns(doc):
+                if isbn in wanted and isbn not in found:
+                    found[isbn] = catkey
+        total = _total_count(page)
+        # Without a total, a page shorter than what we asked for is the only sign that nothing was left out.
+        complete = len(docs) >= total if total is not None else len(docs) < per_page
+        return found, complete
+
+    # Search for several ISBNs. Returns a dict of ISBN -> catkey (or None if not found) for every ISBN passed in.
+    # With the "json" backend, ISBNs with a fresh cache entry are answered from the cache, and the rest go to the catalog in one request.
+    # If that request fails or doesn't return JSON, or a miss can't be trusted (full page), those ISBNs fall back to the HTML search.
+    def search_many(self, isbns):
+        if self.search_backend != "json" or self._json_failed:
+            return {isbn: self.search(isbn) for isbn in isbns}
+        results = {}
+        pending = []
+        for isbn in isbns:
+            entry = self.cache.get("searches", isbn) if self.cache is not None else None
+            if entry is not None and entry.fresh:
+                self.cache.count("searches", "hit")
+                results[isbn] = entry.value
+            else:
+                pending.append(isbn)
+        if not pending:
+            return results
+        try:
+            found, complete = self._json_search(pending)
+        except (requests.RequestException, ValueError, AttributeError) as error:
+            # The JSON search isn't working, so stop trying it for the rest of the run and use the HTML search instead.
+            if not self._json_failed:
+                self._json_failed = True
+                print("Note: the catalog's JSON search failed (" + str(error) + "). Falling back to searching one ISBN at a time.")
+            return {**results, **{isbn: self.search(isbn) for isbn in pending}}
+        for isbn in pending:
+            if isbn in found or complete:
+                results[isbn] = found.get(isbn)
+                if self.cache is not None:
+                    self.cache.count("searches", "miss")
+                    self.cache.put("searches", isbn, results[isbn])
+            else:
+                results[isbn] = self.search(isbn)
+        return results
+
+    # Splits the ISBNs that still need a live search into batches of batch_size (batches of one for the HTML backend).
+    def _batches(self, isbns, known):
+        remaining = [isbn for isbn in dict.fromkeys(isbns) if isbn not in known]
+        return [remaining[i:i + self.batch_size] for i in range(0, len(remaining), self.batch_size)]
+
+    # Search the catalog for every ISBN in the list. Results come back in the same order as the ISBNs that were passed in,
+    # no matter which search finishes first. progress(done, total) is called from the calling thread after each result.
+    def search_all(self, isbns, progress=None):
+        isbns = list(isbns)
+        results = self._resolve_locally(isbns)
+        done = sum(1 for isbn in isbns if isbn in results)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for batch_results in executor.map(self._worker(self.search_many), self._batches(isbns, results)):
+                results.update(batch_results)
+                done += len(batch_results)
+                if progress is not None:
+                    progress(done, len(isbns))
+        return [results[isbn] for isbn in isbns]
+
+    # Search for every ISBN and fetch the JSON record of every catkey found, as one pipeline: as soon as a search finds a catkey, its record fetch is queued,
+    # so fetching overlaps with the searches that are still running. A catkey that several ISBNs resolve to is only fetched once.
+    # This is a generator: it yields (isbn, catkey, record) for every ISBN, in the same order as isbns, as soon as that ISBN's search and record fetch are done.
+    # catkey is None if the ISBN wasn't found; record is the catalog JSON (None if missing), passed through transform(record) in the fetch thread if transform is given.
+    # Since the transformed records are what's kept, a small transform (like records.PullRecord) keeps memory low for very long lists.
+    # known maps ISBNs that were already searched (for example by an interrupted run) to their catkey; those aren't searched again, but their records are still fetched.
+    # on_search(isbn, catkey) is called from the search threads after each new search, so results can be checkpointed as they come in.
+    # If the catkey found for an ISBN turns out to have no record (withdrawn since the offline index's export, the cached search, or the interrupted run),
+    # the ISBN is searched live once more, and counts as not found if that doesn't turn up a record either. So a catkey is never yielded without its record.
+    def search_and_fetch_iter(self, isbns, progress=None, known=None, on_search=None, transform=None):
+        isbns = list(isbns)
+        results = self._resolve_locally(isbns, known)
+        index_isbns = set(results) - set(known or {})
+        searched_again = set()
+        record_futures = {}
+        lock = threading.Lock()
+
+        # Returns (has_record, record). Whether the catalog had a record is kept next to the transformed record, since a transform can make "missing" look like anything.
+        def fetch(catkey):
+            record = self.fetch_record(catkey)
+            return record is not None, transform(record) if transform is not None else record
+
+        # The fetch pool is opened first so that it is shut down last, after every search has had the chance to queue its fetch.
+        # Both pools' requests go through the same limiter, so together they never have more than max_concurrency requests in flight.
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as fetchers, ThreadPoolExecutor(max_workers=self.max_concurrency) as searchers:
+            def queue_fetch(catkey):
+                if catkey is not None:
+                    with lock:
+                        if catkey not in record_futures:
+                            record_futures[catkey] = fetchers.submit(self._worker(fetch), catkey)
+
+            def search_then_queue_fetch(batch):
+                batch_results = self.search_many(batch)
+                for isbn, catkey in batch_results.items():
+                    if on_search is not None:
+                        on_search(isbn, catkey)
+                    queue_fetch(catkey)
+                return batch_results
+
+            # If the caller stops early (an error while writing a row, or Ctrl+C), the searches and fetches that haven't started yet are cancelled,
+            # so the error comes out right away instead of after the rest of the list has been searched.
+            try:
+                done = 0
+                for isbn in dict.fromkeys(isbns):
+                    if isbn in results:
+                        queue_fetch(results[isbn])
+                        done += 1
+                # Batches come back in order, so waiting for the next batch whenever the next ISBN's result isn't in yet keeps the output in order.
+                batch_results_in_order = searchers.map(self._worker(search_then_queue_fetch), self._batches(isbns, results))
+                for isbn in isbns:
+                    while isbn not in results:
+                        batch_results = next(batch_results_in_order)
+                        results.update(batch_results)
+                        done += len(batch_results)
+                        if progress is not None:
+                            progress(done, len(isbns))
+                    catkey = results[isbn]
+                    if catkey is not None and isbn not in searched_again and not record_futures[catkey].result()[0]:
+                        # The record was withdrawn since this catkey was found, so the old result is dropped and a live search decides.
+                        searched_again.add(isbn)
+                        if isbn in index_isbns:
+                            index_isbns.discard(isbn)
+                            self.index_hits -= 1
+                        if self.cache is not None:
+                            self.cache.delete("searches", isbn)
+                        catkey = self.search_many([isbn])[isbn]
+                        queue_fetch(catkey)
+                        if catkey is not None and not record_futures[catkey].result()[0]:
+                            # The catalog still lists the withdrawn record, so as far as the lists go, we don't own this title.
+                            catkey = None
+                            if self.cache is not None:
+                                self.cache.put("searches", isbn, None)
+                        results[isbn] = catkey
+                        if on_search is not None:
+                            on_search(isbn, catkey)
+                    yield isbn, catkey, record_futures[catkey].result()[1] if catkey is not None else None
+            finally:
+                searchers.shutdown(wait=False, cancel_futures=True)
+                fetchers.shutdown(wait=False, cancel_futures=True)
+
+    # Fetch the JSON record of every catkey in the list (each one once), several at a time. Returns a dict of catkey -> record (None if missing).
+    # progress(done, total) is called from the calling thread after each record.
+    def fetch_all(self, catkeys, progress=None):
+        catkeys = list(dict.fromkeys(catkeys))
+        records = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for catkey, record in zip(catkeys, executor.map(self._worker(self.fetch_record), catkeys)):
+                records[catkey] = record
+                if progress is not None:
+                    progress(len(records), len(catkeys))
+        return records
+
+    # The same pipeline as search_and_fetch_iter, collected all at once.
+    # Returns (catkeys, records): catkeys lines up with isbns (None where the ISBN wasn't found), and records maps each catkey to its record.
+    def search_and_fetch(self, isbns, progress=None, known=None, on_search=None, transform=None):
+        catkeys = []
+        records = {}
+        for isbn, catkey, record in self.search_and_fetch_iter(isbns, progress, known, on_search, transform):
+            catkeys.append(catkey)
+            if catkey is not None:
+                records[catkey] = record
+        return catkeys, records
+
+    # Functions handed to the worker threads go through this, so that a profiled run also profiles what runs on them (see RunMetrics.profiled).
+    def _worker(self, func):
+        return self.metrics.profiled(func) if self.metrics is not None else func
+
+    def close(self):
+        self.session.close()
+
+
+# The number of records a JSON search matched in total (on every page): meta.pages.total_count in JSON:API responses, response.numFound in Solr-style ones.
+# Returns None if the response doesn't say.
+def _total_count(page):
+    meta = page.get("meta") if isinstance(page.get("meta"), dict) else {}
+    pages = meta.get("pages") if isinstance(meta.get("pages"), dict) else {}
+    response = page.get("response") if isinstance(page.get("response"), dict) else {}
+    for total in (pages.get("total_count"), response.get("numFound")):
+        if isinstance(total, int):
+            return total
+    return None
+
+
+# Every ISBN listed on a JSON search result, as canonical keys. The ISBN field can be named "isbn", "isbn_t", etc., and in JSON:API responses
+# the fields live under "attributes", sometimes wrapped as {"attributes": {"value": ...}}.
+def _record_isbns(doc):
+    fields = dict(doc)
+    fields.update(doc.get("attributes") or {})
+    isbns = []
+    for name, value in fields.items():
+        if "isbn" not in name.lower():
+            continue
+        if isinstance(value, dict):
+            value = value.get("attributes", value).get("value", "")
+        for isbn in value if isinstance(value, list) else [value]:
+            isbns.append(canonical_isbn(str(isbn).split()[0]) if str(isbn).split() else "")
+    return [isbn for isbn in isbns if isbn]
@@ -0,0 +1,154 @@
+# This module keeps a local SQLite cache of catalog lookups, so that repeat runs don't have to scrape the catalog again for every ISBN and catkey.
+# Most textbooks show up on bookstore list after bookstore list (and semester after semester), so most lookups can be answered from here.
+#
+# Two kinds of entries are stored:
+#   searches - ISBN -> catkey of the top search result. A catkey of NULL means the ISBN was not found in the catalog (a "negative" result).
+#   records  - catkey -> the item's JSON from /catalog/NCSU<catkey>.json
+# Every entry remembers when it was fetched. Found results are trusted for ttl_days, not-found results only for not_found_ttl_days
+# (we may buy the book in the meantime). Once an entry is stale, it is revalidated with the ETag/Last-Modified headers the catalog sent the first time,
+# so an unchanged entry only costs a 304 response. When a table grows past max_entries, the least recently used entries are evicted.
+# Reads don't write anything right away: when each entry was last used is kept in memory and saved in batches (and on put/close),
+# so a long bookstore list doesn't cost a write transaction per lookup, and processes sharing the file don't fight over the write lock.
+# With refresh_ahead_days, entries count as stale that many days before they really expire. The prefetch job (see prefetch.py) uses this to
+# refresh entries ahead of time, so they're still fresh when the next bookstore list comes in.
+
+import sqlite3          # Built-in database library, used so the cache is a single file that needs no server.
+import threading        # The catalog searches run on several threads, so access to the connection is serialized with a lock.
+import time
+
+DAY = 24 * 60 * 60
+
+KINDS = ("searches", "records")
+
+
+# What the cache knows about a single ISBN or catkey. value is the catkey (searches) or the JSON text (records); fresh says whether it can be used as-is.
+class CacheEntry:
+    __slots__ = ("value", "fresh", "etag", "last_modified")
+
+    def __init__(self, value, fresh, etag, last_modified):
+        self.value = value
+        self.fresh = fresh
+        self.etag = etag
+        self.last_modified = last_modified
+
+    # Headers for a conditional GET, so the catalog can answer "304 Not Modified" instead of sending the whole page again.
+    def revalidation_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class CatalogCache:
+    def __init__(self, path, ttl_days=30, not_found_ttl_days=3, max_entries=200000, refresh_ahead_days=0, flush_every=1000):
+        self.path = path
+        self.ttl = ttl_days * DAY
+        self.not_found_ttl = not_found_ttl_days * DAY
+        self.refresh_ahead = refresh_ahead_days * DAY
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        # Per kind, the keys read since the last flush -> when they were last used. Written to the last_used column by _flush_last_used.
+        self._last_used = {kind: {} for kind in KINDS}
+        # Counts of how each lookup was answered, per kind: "hit" (fresh entry), "revalidated" (stale entry confirmed by a 304), "miss" (fetched from the catalog).
+        self.stats = {kind: {"hit": 0, "revalidated": 0, "miss": 0} for kind in KINDS}
+        self._lock = threading.Lock()
+        # Several processes can share the cache file (see run_batch in order_pull_lists.py), so a write waits for the others instead of failing right away.
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for kind, column in (("searches", "isbn"), ("records", "catkey")):
+            self._conn.execute("CREATE TABLE IF NOT EXISTS " + kind + " (" + column + " TEXT PRIMARY KEY, value TEXT, fetched_at REAL, "
+                               "last_used REAL, etag TEXT, last_modified TEXT)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS " + kind + "_last_used ON " + kind + " (last_used)")
+        self._conn.commit()
+
+    def _key_column(self, kind):
+        return "isbn" if kind == "searches" else "catkey"
+
+    # Look up an ISBN (kind="searches") or catkey (kind="records"). Returns a CacheEntry, or None if we've never fetched it.
+    def get(self, kind, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, fetched_at, etag, last_modified FROM " + kind + " WHERE " + self._key_column(kind) + " = ?",
+                                     (str(key),)).fetchone()
+            if row is None:
+                return None
+            self._last_used[kind][str(key)] = now
+            if sum(len(keys) for keys in self._last_used.values()) >= self.flush_every:
+                self._flush_last_used()
+                self._conn.commit()
+        value, fetched_at, etag, last_modified = row
+        ttl = self.not_found_ttl if value is None else self.ttl
+        return CacheEntry(value, now - fetched_at < ttl - self.refresh_ahead, etag, last_modified)
+
+    # Save a freshly fetched result. value=None records a "not found" search result.
+    def put(self, kind, key, value, etag=None, last_modified=None):
+        now = time.time()
+        with self._lock:
+            self._flush_last_used()
+            self._conn.execute("INSERT OR REPLACE INTO " + kind + " (" + self._key_column(kind) + ", value, fetched_at, last_used, etag, last_modified) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", (str(key), value, now, now, etag, last_modified))
+            self._conn.commit()
+
+    # The catalog confirmed (304) that a stale entry hasn't changed, so restart its TTL.
+    def touch(self, kind, key):
+        now = time.time()
+        with self._lock:
+            self._last_used[kind].pop(str(key), None)
+            self._conn.execute("UPDATE " + kind + " SET fetched_at = ?, last_used = ? WHERE " + self._key_column(kind) + " = ?", (now, now, str(key)))
+            self._conn.commit()
+
+    # Write the buffered last_used times to the database, in the caller's transaction. Must be called with the lock held.
+    def _flush_last_used(self):
+        for kind in KINDS:
+            if self._last_used[kind]:
+                self._conn.executemany("UPDATE " + kind + " SET last_used = ? WHERE " + self._key_column(kind) + " = ?",
+                                       [(used, key) for key, used in self._last_used[kind].items()])
+                self._last_used[kind] = {}
+
+    # Forget an entry, so the next lookup goes to the catalog. Used for a search result whose catkey no longer has a record.
+    def delete(self, kind, key):
+        with self._lock:
+            self._last_used[kind].pop(str(key), None)
+            self._conn.execute("DELETE FROM " + kind + " WHERE " + self._key_column(kind) + " = ?", (str(key),))
+            self._conn.commit()
+
+    def count(self, kind, outcome):
+        with self._lock:
+            self.stats[kind][outcome] += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {kind: {"hit": 0, "revalidated": 0, "miss": 0} for kind in KINDS}
+
+    # Share of lookups of this kind that didn't need a full download from the catalog (fresh hits plus 304 revalidations).
+    def hit_rate(self, kind):
+        counts = self.stats[kind]
+        total = sum(counts.values())
+        if total == 0:
+            return 0.0
+        return (counts["hit"] + counts["revalidated"]) / total
+
+    # Drop the least recently used entries so that each table stays under max_entries.
+    def evict(self):
+        with self._lock:
+            # Save the buffered last_used times first, so entries used this run aren't evicted as if they were old.
+            self._flush_last_used()
+            for kind in KINDS:
+                extra = self._conn.execute("SELECT COUNT(*) FROM " + kind).fetchone()[0] - self.max_entries
+                if extra > 0:
+                    self._conn.execute("DELETE FROM " + kind + " WHERE " + self._key_column(kind) + " IN (SELECT " + self._key_column(kind) +
+                                       " FROM " + kind + " ORDER BY last_used LIMIT ?)", (extra,))
+            self._conn.commit()
+
+    # Trims the cache (see evict) and closes it. With evict=False, only the buffered last_used times are saved: when several processes share the file,
+    # one of them trims it once at the end instead.
+    def close(self, evict=True):
+        if evict:
+            self.evict()
+        with self._lock:
+            self._flush_last_used()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,116 @@
+# This module builds and reads an offline index of the catalog: every ISBN in a bulk catalog export, with the catkey of the record it belongs to.
+# With the index in place, most ISBNs on a bookstore list are resolved locally in one vectorized lookup, and only the misses are searched in the live catalog.
+#
+# The index is two arrays saved with numpy in one folder: isbns.npy (sorted ISBN-13s as int64) and catkeys.npy (the catkey for each ISBN, same order).
+# They are memory-mapped when loaded, so opening even a very large index is instant, and a lookup is a binary search (numpy.searchsorted) over all ISBNs at once.
+#
+# Supported exports:
+#   JSON lines (.jsonl/.json) - one record per line, with an "isbn" list and a "catkey" or "id" field (an "NCSU" prefix on the id is dropped).
+#   MARC (.mrc/.marc)         - ISBNs from 020 $a, catkey from the 001 control number. Needs the pymarc library.
+#
+# To build (or rebuild) the index from one or more export files:
+#   python catalog_index.py "G:\...\Textbooks\catalog_index" export1.jsonl export2.mrc
+
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+from isbns import canonical_isbn
+
+
+# Cleans a catkey the same way catalog.parse_catkey does, so catkeys from the index and from a live search look the same.
+def clean_catkey(value):
+    return re.sub('[^A-Za-z0-9]', '', re.sub('^NCSU', '', str(value)))
+
+
+def _jsonl_records(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            catkey = record.get("catkey", record.get("id"))
+            isbns = record.get("isbn", [])
+            if isinstance(isbns, str):
+                isbns = [isbns]
+            # Like 020 $a in MARC, an ISBN can have a qualifier after it, e.g. "0306406152 (v. 1)".
+            isbns = [str(value).split()[0] for value in isbns if str(value).split()]
+            if catkey is not None:
+                yield clean_catkey(catkey), isbns
+
+
+def _marc_records(path):
+    try:
+        from pymarc import MARCReader
+    except ImportError:
+        raise SystemExit("Reading MARC exports needs the pymarc library (pip install pymarc).")
+    with open(path, "rb") as f:
+        for record in MARCReader(f, to_unicode=True, force_utf8=True):
+            if record is None or not record.get_fields("001"):
+                continue
+            catkey = record.get_fields("001")[0].data
+            # 020 $a often has a qualifier after the ISBN, e.g. "9781234567897 (paperback)".
+            isbns = [value.split()[0] for field in record.get_fields("020") for value in field.get_subfields("a") if value.split()]
+            yield clean_catkey(catkey), isbns
+
+
+def export_records(path):
+    if path.lower().endswith((".mrc", ".marc")):
+        return _marc_records(path)
+    return _jsonl_records(path)
+
+
+# Read every export file and write the index arrays to index_dir. If an ISBN appears on more than one record, the first record in the export wins.
+# Returns the number of ISBNs indexed.
+def build_index(export_paths, index_dir):
+    isbn_list, catkey_list = [], []
+    for path in export_paths:
+        for catkey, isbns in export_records(path):
+            for isbn in isbns:
+                key = canonical_isbn(isbn)
+                # Only real 13-digit ISBNs fit in the int64 array. Anything else will simply be searched live.
+                if len(key) == 13 and key.isdigit():
+                    isbn_list.append(int(key))
+                    catkey_list.append(catkey)
+
+    isbn_array = np.array(isbn_list, dtype=np.int64)
+    catkey_array = np.array(catkey_list, dtype="S") if catkey_list else np.array([], dtype="S1")
+    # A stable sort keeps the export order among duplicates, and np.unique's first index then picks the first record for each ISBN.
+    order = np.argsort(isbn_array, kind="stable")
+    isbn_array, catkey_array = isbn_array[order], catkey_array[order]
+    isbn_array, first = np.unique(isbn_array, return_index=True)
+    catkey_array = catkey_array[first]
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "isbns.npy"), isbn_array)
+    np.save(os.path.join(index_dir, "catkeys.npy"), catkey_array)
+    return len(isbn_array)
+
+
+class CatalogIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.isbns = np.load(os.path.join(index_dir, "isbns.npy"), mmap_mode="r")
+        self.catkeys = np.load(os.path.join(index_dir, "catkeys.npy"), mmap_mode="r")
+
+    # Look up many ISBN keys (canonical, see isbns.py) at once. Returns a dict of ISBN key -> catkey for the ISBNs that are in the index.
+    def lookup(self, isbn_keys):
+        keys = [key for key in isbn_keys if len(key) == 13 and key.isdigit()]
+        if not keys or len(self.isbns) == 0:
+            return {}
+        wanted = np.array([int(key) for key in keys], dtype=np.int64)
+        positions = np.searchsorted(self.isbns, wanted)
+        positions = np.minimum(positions, len(self.isbns) - 1)
+        found = np.asarray(self.isbns[positions]) == wanted
+        return {key: self.catkeys[position].decode() for key, position, hit in zip(keys, positions, found) if hit}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        raise SystemExit("Usage: python catalog_index.py <index folder> <export file> [<export file> ...]")
+    count = build_index(sys.argv[2:], sys.argv[1])
+    print("Indexed " + str(count) + " ISBNs into " + sys.argv[1] + ".")
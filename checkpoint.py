@@ -0,0 +1,59 @@
+# This module saves the result of every catalog search to disk as soon as it comes back, so that a run that gets interrupted
+# (network failure, closed window, etc.) can pick up where it stopped instead of starting the whole catalog search over.
+# The checkpoint is a plain text file with one JSON line per searched ISBN: {"isbn": "...", "catkey": "..."} (catkey is null if the ISBN wasn't found).
+# Item records don't need to be checkpointed here: every record fetched is already saved in the catalog cache (see catalog_cache.py).
+# Once the order and pull lists have been written, the checkpoint file is deleted.
+
+import json
+import os
+import threading
+
+
+class SearchCheckpoint:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    # The search results saved by an earlier, interrupted run (ISBN -> catkey or None). Empty if there is no checkpoint.
+    def load(self):
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line can be cut off if the run was killed while writing it. That ISBN just gets searched again.
+                    continue
+                results[entry["isbn"]] = entry["catkey"]
+        return results
+
+    # Save one search result. Called from the search threads, so writes are serialized, and each line is flushed right away.
+    def record(self, isbn, catkey):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+                # Start on a new line if the last one was cut off, so the first result of a resumed run isn't glued onto it (and lost).
+                if self._file.tell() > 0 and not self._ends_with_newline():
+                    self._file.write("\n")
+            self._file.write(json.dumps({"isbn": isbn, "catkey": catkey}) + "\n")
+            self._file.flush()
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # The run finished, so there is nothing left to resume.
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
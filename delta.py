@@ -0,0 +1,71 @@
+# This module supports "delta mode": the bookstore sends updated lists several times a semester, and each one is mostly the same as the last.
+# After every run, a snapshot of the bookstore list that was processed is saved next to it: one fingerprint (hash) per row, along with the row's ISBN key.
+# On the next run, comparing the new list's fingerprints to the snapshot tells us exactly which ISBNs have rows that were added or changed,
+# so only those need to go through the catalog again. Rows that were dropped from the new list are ignored.
+# Every bookstore list gets its own snapshot ("bookstore_snapshot <bookstore list>.csv"), and a list is only ever compared with the snapshot of an earlier list
+# (by the date in its name). Comparing a list with its own snapshot would find no changes at all, and the run would write empty order and pull lists.
+
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+
+
+# One 64-bit fingerprint per row, computed over the given columns. The columns are compared as text, so 101 and "101" fingerprint the same.
+def row_fingerprints(df, columns):
+    columns = [column for column in columns if column in df.columns]
+    return pd.util.hash_pandas_object(df[columns].astype(str), index=False)
+
+
+SNAPSHOT_PREFIX = "bookstore_snapshot "
+
+
+def snapshot_path(sem_dir, bkstr_file_name):
+    return os.path.join(sem_dir, SNAPSHOT_PREFIX + bkstr_file_name + ".csv")
+
+
+# The date in a bookstore list's name ("FallBookstoreList 9-8-2023" -> 2023-09-08), or None if it doesn't have one.
+def list_date(bkstr_file_name):
+    match = re.search('\s(\d{1,2}-\d{1,2}-\d{4})$', bkstr_file_name.strip())
+    if match is None:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%m-%d-%Y")
+    except ValueError:
+        return None
+
+
+# The snapshot to compare bookstore list bkstr_file_name with: the one of the latest bookstore list in sem_dir dated before it.
+# Returns (bookstore list name, snapshot path), or None if no earlier list has a snapshot (or the list's name has no date to compare by).
+def previous_snapshot(sem_dir, bkstr_file_name):
+    current = list_date(bkstr_file_name)
+    if current is None:
+        return None
+    earlier = []
+    for file in os.listdir(sem_dir):
+        if file.startswith(SNAPSHOT_PREFIX) and file.endswith(".csv"):
+            name = file[len(SNAPSHOT_PREFIX):-len(".csv")]
+            date = list_date(name)
+            if date is not None and date < current:
+                earlier.append((date, name))
+    if not earlier:
+        return None
+    name = max(earlier)[1]
+    return name, snapshot_path(sem_dir, name)
+
+
+# Save the processed bookstore list's fingerprints, keyed by ISBN.
+def save_snapshot(df, columns, path):
+    snapshot = pd.DataFrame({"ISBN Key": df["ISBN Key"].values, "Row Hash": row_fingerprints(df, columns).values.astype(str)})
+    temp = path + ".tmp"
+    snapshot.to_csv(temp, index=False)
+    os.replace(temp, path)
+
+
+# The ISBN keys of every row in df that is new or different compared with the snapshot at path.
+def changed_isbns(df, columns, path):
+    snapshot = pd.read_csv(path, dtype=str)
+    previous = set(zip(snapshot["ISBN Key"].fillna(''), snapshot["Row Hash"]))
+    current = zip(df["ISBN Key"], row_fingerprints(df, columns).values.astype(str))
+    return {isbn for isbn, row_hash in current if (isbn, row_hash) not in previous}
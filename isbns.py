@@ -0,0 +1,61 @@
+# This module turns the many ways an ISBN shows up in our spreadsheets into one canonical key.
+# Depending on where it comes from, the same ISBN can be an int (bookstore list), a float (any column pandas read with blanks in it),
+# a string (SpecialTitles, which is read with dtype=str), an ISBN-10 with its leading zeros stripped, or a string with hyphens.
+# Comparing those directly silently fails (9781234567897 != "9781234567897"), so everything is compared through canonical_isbn() instead.
+#
+# The canonical key is a 13-digit string. ISBN-10s with a valid check digit are converted to their ISBN-13.
+# Values that aren't a valid ISBN-10 are kept as their digits, so they still match themselves. Blank and 0 values become "".
+
+import re
+from functools import lru_cache
+
+
+def isbn10_is_valid(isbn):
+    if not re.fullmatch('[0-9]{9}[0-9X]', isbn):
+        return False
+    total = sum((10 - i) * int(digit) for i, digit in enumerate(isbn[:9]))
+    total += 10 if isbn[9] == "X" else int(isbn[9])
+    return total % 11 == 0
+
+
+def isbn13_check_digit(first_twelve):
+    total = sum(int(digit) * (1 if i % 2 == 0 else 3) for i, digit in enumerate(first_twelve))
+    return str((10 - total % 10) % 10)
+
+
+def isbn13_is_valid(isbn):
+    return bool(re.fullmatch('[0-9]{13}', isbn)) and isbn13_check_digit(isbn[:12]) == isbn[12]
+
+
+# Converts a valid ISBN-10 to its ISBN-13: prefix 978, drop the old check digit, and compute the new one.
+def isbn10_to_isbn13(isbn):
+    first_twelve = "978" + isbn[:9]
+    return first_twelve + isbn13_check_digit(first_twelve)
+
+
+# The bookstore list repeats the same ISBN for every course section, so the result for each value is cached.
+@lru_cache(maxsize=None)
+def canonical_isbn(value):
+    if value is None:
+        return ""
+    # Floats come from pandas columns that had blanks in them (9781234567897.0). NaN is a blank cell.
+    if isinstance(value, float):
+        if value != value:
+            return ""
+        value = int(value)
+    text = str(value).strip().upper()
+    text = re.sub('\\.0+$', '', text)
+    text = re.sub('[^0-9X]', '', text)
+    if text.strip("0") == "":
+        return ""
+    # Anything 10 digits or shorter is an ISBN-10 (possibly with its leading zeros lost along the way).
+    if len(text) <= 10:
+        text = text.zfill(10)
+        if isbn10_is_valid(text):
+            return isbn10_to_isbn13(text)
+    return text
+
+
+# Canonical keys for a whole column (or list) at once.
+def canonical_isbns(values):
+    return [canonical_isbn(value) for value in values]
@@ -0,0 +1,74 @@
+# This module keeps a ledger of the ISBNs on every order list and pull list already produced for a semester, so that they can be excluded from the next list
+# without opening every old workbook again. Each semester folder gets its own small SQLite file, which records which workbook every ISBN came from.
+# A workbook is only read again if it is new, or if its modification time or size changed and its contents (SHA-1 hash) really are different.
+# Workbooks that were deleted from the folder are dropped from the ledger, so their ISBNs stop being excluded.
+
+import os
+import sqlite3
+
+from isbns import canonical_isbns
+from workbooks import file_hash, read_sheets     # SHA-1 fingerprints (so a file that was just touched isn't read again) and the fast workbook reader.
+
+# Which sheet and column each kind of list keeps its ISBNs in.
+LIST_COLUMNS = {
+    "order": ("Order List", "ISBN-13"),
+    "pull": ("Pull List", "Bookstore ISBN"),
+}
+
+
+class ListLedger:
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, kind TEXT, mtime REAL, size INTEGER, sha1 TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS isbns (file TEXT, kind TEXT, isbn TEXT)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS isbns_kind ON isbns (kind)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS isbns_file ON isbns (file)")
+        self._conn.commit()
+
+    # Bring the ledger up to date with the workbooks in a semester folder. files_by_kind maps "order"/"pull" to the paths of the workbooks of that kind.
+    # Returns the names of the workbooks that had to be read.
+    def sync(self, files_by_kind):
+        known = {name: (kind, mtime, size, sha1) for name, kind, mtime, size, sha1 in self._conn.execute("SELECT name, kind, mtime, size, sha1 FROM files")}
+        current = set()
+        ingested = []
+        for kind, paths in files_by_kind.items():
+            for path in paths:
+                name = os.path.basename(path)
+                current.add(name)
+                stat = os.stat(path)
+                if name in known:
+                    _, mtime, size, sha1 = known[name]
+                    if mtime == stat.st_mtime and size == stat.st_size:
+                        continue
+                    new_sha1 = file_hash(path)
+                    if new_sha1 == sha1:
+                        self._conn.execute("UPDATE files SET mtime = ?, size = ? WHERE name = ?", (stat.st_mtime, stat.st_size, name))
+                        continue
+                else:
+                    new_sha1 = file_hash(path)
+                self._ingest(path, name, kind, stat, new_sha1)
+                ingested.append(name)
+        # Forget workbooks that are no longer in the folder.
+        for name in set(known) - current:
+            self._conn.execute("DELETE FROM isbns WHERE file = ?", (name,))
+            self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+        self._conn.commit()
+        return ingested
+
+    def _ingest(self, path, name, kind, stat, sha1):
+        sheet, column = LIST_COLUMNS[kind]
+        df = read_sheets(path, {sheet: [column]})[sheet].fillna('')
+        isbns = set(canonical_isbns(df[column]))
+        isbns.discard("")
+        self._conn.execute("DELETE FROM isbns WHERE file = ?", (name,))
+        self._conn.executemany("INSERT INTO isbns (file, kind, isbn) VALUES (?, ?, ?)", [(name, kind, isbn) for isbn in isbns])
+        self._conn.execute("INSERT OR REPLACE INTO files (name, kind, mtime, size, sha1) VALUES (?, ?, ?, ?, ?)",
+                           (name, kind, stat.st_mtime, stat.st_size, sha1))
+
+    # Every ISBN (canonical key) on the lists of one kind ("order" or "pull").
+    def isbns(self, kind):
+        return {isbn for (isbn,) in self._conn.execute("SELECT DISTINCT isbn FROM isbns WHERE kind = ?", (kind,))}
+
+    def close(self):
+        self._conn.close()
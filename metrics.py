@@ -0,0 +1,167 @@
+# This module measures where the time goes in a run of the order/pull list script, and saves it as a JSON run report next to the order and pull lists.
+# It records the wall time of every stage of the script (loading workbooks, excluding previous lists, matching special titles, searching the catalog, ...),
+# and for every catalog request: how long it took, its status code, how many bytes came back, and whether it had to be retried.
+# The report summarizes the requests per kind (searches / records) as latency percentiles and a histogram, and adds the cache hit ratios (see catalog_cache.py).
+# With profile=True, every stage also runs under cProfile, and its stats are saved next to the report (open them with pstats or snakeviz).
+# cProfile only sees the thread that turned it on, so the functions CatalogClient runs on its worker threads (the searches, cache lookups, JSON parsing,
+# and PullRecord) are wrapped with profiled(), which profiles them on their own thread and adds them to the stage's stats.
+#
+# Progress replaces the "Processing item #..." line that used to be printed for every single item: it rewrites one status line at most once a second.
+
+import cProfile
+import json
+import pstats
+import threading
+import time
+
+import numpy as np
+
+# Upper bounds (in milliseconds) of the latency histogram buckets. The last bucket holds everything slower.
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class RunMetrics:
+    def __init__(self, profile=False):
+        self.started = time.perf_counter()
+        self.profile = profile
+        self.stages = {}            # Stage name -> seconds, in the order the stages first ran.
+        self.profiles = {}          # Stage name -> cProfile.Profile, if profiling.
+        self.thread_profiles = {}   # Stage name -> the cProfile.Profile of every worker thread that ran a profiled() function during it.
+        self._thread_local = threading.local()
+        self.requests = {}          # Request kind -> {"latencies": [...], "statuses": {...}, "bytes": ..., "first": ..., "last": ...}
+        self._stage = None
+        self._stage_started = None
+        self._lock = threading.Lock()
+
+    # Start timing a stage, which ends the stage that was running before it. Running a stage name again adds to its time.
+    # The script is one long sequence of steps, so marking where each stage starts is all that's needed.
+    def stage(self, name):
+        self.stop()
+        self._stage = name
+        self._stage_started = time.perf_counter()
+        if self.profile:
+            self.profiles.setdefault(name, cProfile.Profile()).enable()
+
+    # End the stage that is running (if any).
+    def stop(self):
+        if self._stage is None:
+            return
+        if self.profile:
+            self.profiles[self._stage].disable()
+        self.stages[self._stage] = self.stages.get(self._stage, 0.0) + time.perf_counter() - self._stage_started
+        self._stage = None
+
+    # Returns func wrapped so that, while profiling, every call is profiled on the thread that makes it and counted towards the running stage.
+    # Each worker thread keeps one profiler per stage, switched on only while it runs func. Without profiling, func is returned as-is.
+    def profiled(self, func):
+        if not self.profile:
+            return func
+
+        def run_profiled(*args, **kwargs):
+            stage = self._stage
+            if stage is None:
+                return func(*args, **kwargs)
+            profilers = self._thread_local.__dict__.setdefault("profilers", {})
+            profiler = profilers.get(stage)
+            if profiler is None:
+                profiler = profilers[stage] = cProfile.Profile()
+                with self._lock:
+                    self.thread_profiles.setdefault(stage, []).append(profiler)
+            try:
+                profiler.enable()
+            except ValueError:
+                # Newer Pythons only allow one profiler at a time, but that one (the stage's) already sees every thread.
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+        return run_profiled
+
+    # Called by CatalogClient (from its worker threads) after every catalog request. status is None if the request failed without a response.
+    # retry is True if this attempt is going to be retried.
+    def record_request(self, kind, started, latency, status=None, nbytes=0, retry=False):
+        with self._lock:
+            stats = self.requests.setdefault(kind, {"latencies": [], "statuses": {}, "bytes": 0, "retries": 0, "first": started, "last": started})
+            stats["latencies"].append(latency)
+            status = "error" if status is None else str(status)
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+            stats["bytes"] += nbytes
+            stats["retries"] += 1 if retry else 0
+            stats["first"] = min(stats["first"], started)
+            stats["last"] = max(stats["last"], started + latency)
+
+    # Everything measured so far, as a dict that can be saved as JSON. cache is the CatalogCache of the run (optional); extra is added to the report as-is.
+    def report(self, cache=None, **extra):
+        self.stop()
+        report = dict(extra)
+        report["total_seconds"] = round(time.perf_counter() - self.started, 3)
+        report["stages"] = {name: round(seconds, 3) for name, seconds in self.stages.items()}
+        report["requests"] = {kind: _request_summary(stats) for kind, stats in self.requests.items()}
+        if cache is not None:
+            report["cache"] = {kind: dict(counts, hit_rate=round(cache.hit_rate(kind), 4)) for kind, counts in cache.stats.items()}
+        return report
+
+    # Save the report as JSON at path. If the stages were profiled, their stats are saved as "<report name> - <stage>.prof" in the same folder,
+    # with the worker threads' stats of each stage merged into it.
+    def write_report(self, path, cache=None, **extra):
+        report = self.report(cache, **extra)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        base = path[:-len(".json")] if path.endswith(".json") else path
+        for name, profiler in self.profiles.items():
+            # A worker profiler that was never switched on (see profiled) has no stats, and pstats refuses to load those.
+            thread_profilers = [thread_profiler for thread_profiler in self.thread_profiles.get(name, []) if _has_stats(thread_profiler)]
+            pstats.Stats(profiler, *thread_profilers).dump_stats(base + " - " + name + ".prof")
+        return report
+
+
+def _has_stats(profiler):
+    profiler.create_stats()
+    return bool(profiler.stats)
+
+
+# Latency percentiles (in milliseconds), a latency histogram, status codes, retries and bytes for one kind of request.
+# busy_seconds adds up the time spent on every request; span_seconds is the wall time from the first request to the end of the last one.
+# Searches and record fetches overlap (see CatalogClient.search_and_fetch_iter), so their spans are how long each kind of request kept the run busy.
+def _request_summary(stats):
+    latencies_ms = np.array(stats["latencies"]) * 1000
+    p50, p90, p95, p99 = np.percentile(latencies_ms, [50, 90, 95, 99]) if len(latencies_ms) else (0, 0, 0, 0)
+    counts = np.bincount(np.searchsorted(LATENCY_BUCKETS_MS, latencies_ms), minlength=len(LATENCY_BUCKETS_MS) + 1)
+    labels = ["<=" + str(bound) + "ms" for bound in LATENCY_BUCKETS_MS] + [">" + str(LATENCY_BUCKETS_MS[-1]) + "ms"]
+    span = stats["last"] - stats["first"]
+    return {
+        "count": len(latencies_ms),
+        "retries": stats["retries"],
+        "statuses": stats["statuses"],
+        "bytes": stats["bytes"],
+        "busy_seconds": round(float(latencies_ms.sum()) / 1000, 3),
+        "span_seconds": round(span, 3),
+        "requests_per_second": round(len(latencies_ms) / span, 2) if span > 0 else None,
+        "latency_ms": {"mean": round(float(latencies_ms.mean()), 1) if len(latencies_ms) else 0,
+                       "p50": round(float(p50), 1), "p90": round(float(p90), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1),
+                       "max": round(float(latencies_ms.max()), 1) if len(latencies_ms) else 0},
+        "latency_histogram": dict(zip(labels, (int(count) for count in counts))),
+    }
+
+
+# A status line that is rewritten in place, at most once every interval seconds (and always for the last item), with the rate and estimated time left.
+class Progress:
+    def __init__(self, label, interval=1.0):
+        self.label = label
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._last_print = None
+
+    def __call__(self, done, total):
+        now = time.perf_counter()
+        if done < total and self._last_print is not None and now - self._last_print < self.interval:
+            return
+        self._last_print = now
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0
+        line = self.label + " " + str(done) + "/" + str(total) + " (" + str(round(rate, 1)) + "/s"
+        if 0 < done < total and rate > 0:
+            line += ", about " + str(round((total - done) / rate)) + "s left"
+        line += ")"
+        print("\r" + line.ljust(70), end="\n" if done >= total else "", flush=True)
@@ -1,417 +1,606 @@
 # This script creates the pull list and order list using the cleaned bookstore data.
 # Last modified: 01-19-24 by GI
-
+#
+# Run it without arguments to be asked for the semester and bookstore list, like always:
+#   python order_pull_lists.py
+# Or give them on the command line (several bookstore lists of one semester are processed one after the other, in the order given):
+#   python order_pull_lists.py "Fall 2023" "FallBookstoreList 9-8-2023" [--delta] [--root <Textbooks folder>]
+# To process bookstore lists from several semesters in one go, pass each one as --job "<semester>/<bookstore list>". With --processes, the semesters are
+# split over that many worker processes; every list of the same semester still runs in order, in the same process.
+#   python order_pull_lists.py --job "Fall 2023/FallBookstoreList 9-8-2023" --job "Spring 2024/SpringBookstoreList 1-5-2024" --processes 2
+#
+# The steps are also importable from other scripts: load_special_titles(), open_catalog(), create_lists() and run_batch(). One SpecialTitles and one catalog
+# session (connections, cache, offline index) can be passed to any number of create_lists() calls, so they're only loaded once.
+
+import argparse
 import pandas as pd     # Pandas library to handle dataframes and spreadsheet manipulation.
-import requests         # HTTP requests library used to scrape the catalog.
 import re               # Regular Expressions library used to parse strings and retrieve relevant data from large blocks of text on a webpage.
 import time             # Allows us to track how long the script takes to run for assessment purposes.
 import os               # Grants access to our machine's operating system so that we can access and export files on the G:/ drive.
+from concurrent.futures import ProcessPoolExecutor  # Runs several semesters at the same time in batch mode.
+from catalog import CatalogClient   # Shared catalog session, concurrent ISBN searching, and retry/rate limiting (see catalog.py).
+from catalog_cache import CatalogCache  # Local cache of catalog lookups, so repeat runs only hit the catalog for new or stale entries (see catalog_cache.py).
+from isbns import canonical_isbns, isbn13_is_valid  # Turns ISBNs from any spreadsheet into one comparable key (see isbns.py).
+from ledger import ListLedger       # Keeps track of the ISBNs on this semester's previous order and pull lists (see ledger.py).
+from workbooks import read_sheets   # Reads only the sheets and columns we need from a workbook, with Parquet copies for re-runs (see workbooks.py).
+from delta import changed_isbns, previous_snapshot, save_snapshot, snapshot_path  # Finds the rows that changed since the last bookstore list (see delta.py).
+from checkpoint import SearchCheckpoint  # Saves search results as they come in, so an interrupted run can resume (see checkpoint.py).
+from catalog_index import CatalogIndex  # Offline ISBN -> catkey index built from a bulk catalog export (see catalog_index.py).
+from records import PULL_LIST_COLUMNS, PullRecord  # Pulls the pull list fields out of the catalog's item JSON (see records.py).
+from writers import StreamingWorkbook   # Writes the order and pull list spreadsheets row by row (see writers.py).
+from metrics import Progress, RunMetrics    # Per-stage timings, catalog request statistics, and the run report (see metrics.py).
 
-# Set the start time before the script begins running.
-start = time.time()
 pd.options.mode.chained_assignment = None
 
+# The Textbooks folder on the G:/ drive, which holds SpecialTitles, the catalog cache, and one folder per semester. The TEXTBOOKS_DIR environment variable
+# (or --root) can point the script somewhere else (for example, the synthetic data the benchmarks in the benchmarks folder generate).
+TEXTBOOKS_DIR = os.environ.get("TEXTBOOKS_DIR", "G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks")
+
+CATALOG_URL = os.environ.get("CATALOG_URL", "https://catalog.lib.ncsu.edu/")    # This URL string prepends the information needed to search an item by ISBN.
+MAX_CATALOG_SEARCHES = int(os.environ.get("CATALOG_MAX_SEARCHES", 8))           # Maximum number of catalog searches running at the same time. The client lowers this on its own if the catalog slows down.
+CATALOG_SEARCH_BACKEND = "json"                 # "json" searches 25 ISBNs per request using the catalog's JSON results; "html" searches one ISBN per request (the original way).
+                                                # If the JSON search stops working, the script falls back to "html" on its own.
+
+# At most this many ISBNs with an invalid check digit are listed at the end of a run (all of them are in the run report).
+MAX_INVALID_ISBNS_SHOWN = 20
+
+# These are the only columns of the bookstore list that end up on the order and pull lists, so they're the only ones we read.
+BOOKSTORE_COLUMNS = ['Term', 'Dept', 'Crs', 'Sect', 'Author', 'Binding', 'Title', 'ISBN-13', 'Edition']
+
+# The cells of the order and pull lists are formatted to have text wrapping, top vertical alignment, and specific column widths for readability purposes.
+PULL_LIST_WIDTHS = [('A:A', 12),        # dept course-sect
+                    ('B:B', 10),        # catkeys
+                    ('C:D', 45),        # title and author
+                    ('E:E', 35),        # item location
+                    ('F:F', 20),        # call number
+                    ('G:G', 10),        # item type
+                    ('H:H', 15),        # bookstore ISBN
+                    ('I:I', 15),        # all ISBNs
+                    ('J:J', 10),        # edition
+                    ('K:K', 5),         # year published
+                    ('L:L', 15),        # barcodes
+                    ('M:M', 20)]        # access restrictions
+ORDER_LIST_WIDTHS = [('A:A', 5),        # term
+                     ('B:B', 15),       # dept crs-sect
+                     ('C:C', 30),       # author
+                     ('D:D', 15),       # cover
+                     ('E:E', 60),       # title
+                     ('F:F', 15),       # isbn-13
+                     ('G:G', 15)]       # edition
+
+
 # ***********************
-# User Input & File Setup
+# File Setup
 # ***********************
 
-# Retrieve semester from user. This is then used to isolate the semester so we can create a directory path to the relevant files. We also save a list of all the files
-# beginning with the semester name so that we can display them to the user. This prevents having to open the file explorer to get the exact file name.
-sem_folder = input("Enter the semester in [semester] [year] format (ex: Fall 2023). Note: this is case-sensitive!\n")
-sem = ''.join(re.findall('^\W*([\w-]+)', sem_folder))
-sem_file_path = os.listdir("G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\semesters\\" + sem_folder + "\\")
-file_options = []
-for file in sem_file_path: 
-    if file.startswith(sem + "Book"): file_options.append(file)
-
-# Display the possible bookstore list options to the user. Then, retrieve exact bookstore list file name from user.
-print("\nBookstore lists in this directory:\n")
-print("\n".join(file_options))
-bkstr_file_name = input("\nEnter the full name of the bookstore list spreadsheet (ex: FallBookstoreList 9-8-2023). Note: this is case-sensitive!\n")
-
-# Ask if there is a previous bookstore list to compare to from user.
-prev_ord_lists = []
-prev_pull_lists = []
-print("\nThe following order and pull lists will be used to exclude titles that have already been ordered or previously pulled:\n")
-for file in sem_file_path:
-    if file.startswith("order_list"): 
-        print(file)
-        prev_ord_lists.append(file)
-    elif file.startswith("pull_list"):
-        print(file)
-        prev_pull_lists.append(file)
-print("\nNote: If this list is empty, no previous order lists for the " + sem_folder + " semester were found.")
-print("If this is an error, make sure the previous order list exists, and verify it is named correctly (order_list [date]).\n")
-
-# Ask if user would like to be notified when script is done running. By default, the notification will assume no.
-# If the user selects yes, the script will automatically open the file folder of the exported pull/order lists.
-# notify_user = input("Would you like to be notified when the script is done running? The script will automatically open to the location of the order and pull lists upon completion. \nType yes or no below.\n").lower()
-# if notify_user != ("yes" or "no"):  notify_user == "no"
-
-# Extract the date from the filename entered above - this will be used to later name the order and pull list files, so that they match the bookstore list date
-bkstr_file_date = re.sub(" ", "", ((re.search('\s(.*)', bkstr_file_name)).group()))
-bkstr_file_with_path = "G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\semesters\\" + sem_folder + "\\" + bkstr_file_name + ".xlsx"
-
-# **********************************
-# Handling Previously Ordered and Pulled Titles
-# **********************************
-
-# Retrieve ISBNs from previous order lists, if they exist. These will be excluded from the bookstore list.
-prev_ord_isbns = []
-
-for file in prev_ord_lists:
-    temp_ord_df = pd.read_excel("G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\semesters\\" + sem_folder + "\\" + file, sheet_name='Order List').fillna('')
-    prev_ord_isbns.extend(temp_ord_df["ISBN-13"])
-
-# Dedupe the ISBNs gathered from previous order lists.
-prev_ord_isbns = list(set(prev_ord_isbns))
-prev_ord_df = pd.DataFrame({'Previously Ordered ISBNs': prev_ord_isbns}).astype(str)
-
-# Do the same with previous pull lists.
-prev_pull_isbns = []
-
-for file in prev_pull_lists:
-    temp_pull_df = pd.read_excel("G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\semesters\\" + sem_folder + "\\" + file, sheet_name='Pull List').fillna('')
-    prev_pull_isbns.extend(temp_pull_df["Bookstore ISBN"])
-
-prev_pull_isbns = list(set(prev_pull_isbns))
-
-# Create a dataframe from the "For database process" tab of the bookstore list.
-tb_df = pd.read_excel(bkstr_file_with_path, sheet_name='formatted for DB processing').fillna('')
-
-# Remove ISBN matches of previous order lists from the current bookstore list. Do the same for previously pulled ISBNs.
-tb_df = tb_df[~tb_df["ISBN-13"].isin(prev_ord_isbns)]
-tb_df = tb_df[~tb_df["ISBN-13"].isin(prev_pull_isbns)]
+def semester_dir(sem_folder, textbooks_dir=TEXTBOOKS_DIR):
+    return os.path.join(textbooks_dir, "semesters", sem_folder, "")
+
+
+# The bookstore lists in a semester folder: every file beginning with the semester name (e.g. "FallBookstoreList 9-8-2023.xlsx"), without the extension.
+def bookstore_list_options(sem_folder, textbooks_dir=TEXTBOOKS_DIR):
+    sem = ''.join(re.findall('^\W*([\w-]+)', sem_folder))
+    return [os.path.splitext(file)[0] for file in sorted(os.listdir(semester_dir(sem_folder, textbooks_dir))) if file.startswith(sem + "Book")]
+
+
+# The order and pull lists already in a semester folder.
+# Only the .xlsx workbooks count: the CSV/Parquet copies of the lists (see extra_list_copies in create_lists) have the same names.
+# own_lists are the file names the current run writes. They're never previous lists: if a run wrote its pull list but then failed on the order list,
+# the resumed run would otherwise exclude every title on that pull list and overwrite it with an empty one.
+def previous_lists(sem_dir, own_lists=()):
+    prev_ord_lists = []
+    prev_pull_lists = []
+    for file in os.listdir(sem_dir):
+        if file in own_lists:
+            continue
+        if file.startswith("order_list") and file.endswith(".xlsx"):
+            prev_ord_lists.append(file)
+        elif file.startswith("pull_list") and file.endswith(".xlsx"):
+            prev_pull_lists.append(file)
+    return prev_ord_lists, prev_pull_lists
+
 
 # *********************************************************
 # Handling Special Titles (Excluded and Replacement Titles)
 # *********************************************************
 
-# Create three dataframes from the Special Titles spreadsheet: replaced titles, excluded titles, and titles with replacements that have no ISBN matches in the catalog (these get matched via catkey).
-sptitles_replace_df = pd.read_excel('G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\SpecialTitles.xlsx', sheet_name='replace', dtype=str).fillna('')
-sptitles_exclude_df = pd.read_excel('G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\SpecialTitles.xlsx', sheet_name='exclude', dtype=str).fillna('')
-
-# Create a list of deduped, unique ISBN-13s from the bookstore data.
-unique_isbns = list(set(tb_df["ISBN-13"]))
-
-# Add leading zeros back to entries in replaced/excluded lists
-sptitles_replace_df["Bookstore ISBN"] = [str(isbn).zfill(10) if len(isbn) < 10 else isbn for isbn in sptitles_replace_df["Bookstore ISBN"]]
-sptitles_replace_df["Catalog ISBN"] = [str(isbn).zfill(10) if len(isbn) < 10 else isbn for isbn in sptitles_replace_df["Catalog ISBN"]]
-
-# Create a list of key-value pairs for the Special Titles "replace" spreadsheet. Bookstore ISBNs are paired with Catalog ISBNs for replacements.
-replacement_isbns = dict(zip(sptitles_replace_df["Bookstore ISBN"], sptitles_replace_df["Catalog ISBN"]))
-# Create a list of ISBNs to exclude from the bookstore list.
-excluded_isbns = list(sptitles_exclude_df["Bookstore ISBN"])
-# Create a list of key-value pairs for the replace without ISBN matches spreadsheet.
-
-# Handling replacement titles.
-bkstr_isbn_to_replace = []
-final_replacement_isbn = []
-count = 0
-
-# For every key in the list of replacement ISBNs, see if there's a match in the list of deduped ISBNs from the bookstore list. If there's a match, save these matches to separate lists.
-# Then, remove those matched ISBNs from the list of deduped bookstore ISBNs. This prevents the script from attempting to add ISBNs we have replacements for to the order list.
-for key in replacement_isbns.keys():
-    for isbn in unique_isbns:
-        if isbn != '':
-            if int(isbn) == int(key):
-                bkstr_isbn_to_replace.append(key)
-                final_replacement_isbn.append(int(replacement_isbns[key]))
-                unique_isbns.remove(isbn)
-
-# Create a dataframe of the current bookstore list's ISBNs to replace, and the replaced ISBNs. This will later become the "Replaced ISBNs" tab on the order list spreadsheet.
-# We'll also use the final_replacement_isbn list and add those ISBNs to the pull list, and exclude them from the order list. 
-final_replacements_df = pd.DataFrame({'Bookstore ISBNs to Replace': bkstr_isbn_to_replace,
-                                      'Replacement ISBNs': final_replacement_isbn})
-final_replacements_df['Bookstore ISBNs to Replace'] = final_replacements_df['Bookstore ISBNs to Replace'].astype(str)
-final_replacements_df['Replacement ISBNs'] = final_replacements_df['Replacement ISBNs'].astype(str)
-final_replacements_df["Replacement ISBNs"] = [str(isbn).zfill(10) if len(isbn) < 10 else isbn for isbn in final_replacements_df["Replacement ISBNs"]]
+# The two sheets of the Special Titles spreadsheet, as canonical ISBN keys (see isbns.py): replacement_isbns pairs Bookstore ISBNs with Catalog ISBNs for replacements,
+# and excluded_isbns is the set of ISBNs to exclude from the bookstore list.
+class SpecialTitles:
+    def __init__(self, replacement_isbns, excluded_isbns):
+        self.replacement_isbns = replacement_isbns
+        self.excluded_isbns = excluded_isbns
+
+    # The replacement for a bookstore ISBN. If the replacement ISBN has a replacement of its own, follow it through to the last one.
+    def final_replacement(self, isbn):
+        replacement = self.replacement_isbns[isbn]
+        seen = {isbn}
+        while replacement in self.replacement_isbns and replacement not in seen:
+            seen.add(replacement)
+            replacement = self.replacement_isbns[replacement]
+        return replacement
+
+
+# Read the Special Titles spreadsheet. The workbook is opened once for both sheets, and (like the bookstore list) a parsed copy is kept in sidecar_dir.
+def load_special_titles(textbooks_dir=TEXTBOOKS_DIR):
+    sptitles = read_sheets(os.path.join(textbooks_dir, "SpecialTitles.xlsx"),
+                           {'replace': ['Bookstore ISBN', 'Catalog ISBN'], 'exclude': ['Bookstore ISBN']}, dtype=str, sidecar_dir=os.path.join(textbooks_dir, "parquet_cache"))
+    sptitles_replace_df = sptitles['replace'].fillna('')
+    sptitles_exclude_df = sptitles['exclude'].fillna('')
+
+    replacement_isbns = dict(zip(canonical_isbns(sptitles_replace_df["Bookstore ISBN"]), canonical_isbns(sptitles_replace_df["Catalog ISBN"])))
+    replacement_isbns.pop("", None)
+    excluded_isbns = set(canonical_isbns(sptitles_exclude_df["Bookstore ISBN"]))
+    excluded_isbns.discard("")
+    return SpecialTitles(replacement_isbns, excluded_isbns)
+
 
 # *********************
-# Searching the Catalog
+# The Catalog Session
 # *********************
 
-# Handling excluded titles. This creates a list of all matches between the deduped ISBNs and a list of ISBNs to exclude. 
-excl_matches = []
-for isbn in excluded_isbns: 
-    if float(isbn) in unique_isbns: 
-        excl_matches.append(isbn)
-        unique_isbns.remove(float(isbn))
-
-# Create a dataframe of the bookstore items we can exclude.
-final_exclusions_df = pd.DataFrame({'Bookstore ISBNs to Exclude': excl_matches})
-
-catalog_url = "https://catalog.lib.ncsu.edu/"    # This URL string prepends the information needed to search an item by ISBN.
-catkeys = []                                    # Contains a list of catkeys scraped from searching by ISBN.
-isbns_not_found = []                            # Contains a list of ISBNs not found in the search results.
-bookstore_isbns_in_catalog = []                            # Contains a list of ISBNs that were found, and are captured in the bookstore data. 
-isbn_errors = 0                                 # Bookstore ISBNs that = 0 or are blank spaces. We'll count these up to save for later.
-                                                # Specificed as bookstore ISBNs here, to differentiate from the list of all possible ISBNs found in the item's catalog entry.
-
-# Add the replaced ISBNs to the list of deduped ISBNs from the bookstore. These will eventually make it to the pull list.
-unique_isbns.extend(final_replacements_df['Replacement ISBNs'])
-
-# WIP for the next two: turn these for loops into a function, since the same process is repeated twice.
-for key in replacement_isbns.keys():
-    for isbn in unique_isbns:
-        if isbn != '':
-            if int(isbn) == int(key):
-                bkstr_isbn_to_replace.append(key)
-                final_replacement_isbn.append(int(replacement_isbns[key]))
-                unique_isbns.remove(isbn)
-
-# Status update messages. This script currently takes around 40 minutes to run on 1,200 items, so having status updates is helpful to note where the script is at in processing.
-print("\n********************************************************************************************\nProcessing " + str(len(unique_isbns)) + " ISBNs.")
-print(str(len(excl_matches)) + " ISBNs will be excluded. Check 'Excluded Titles' tab on the order list for details.")
-print(str(len(prev_ord_isbns)) + " ISBNs were previously ordered. Check 'Previously Ordered' tab on the order list for details.")
-print(str(len(prev_pull_isbns)) + " ISBNs were previously pulled. These will be excluded from the pull list.")
-print("**********************************************************************************************\n")
-
-# Detailed overview:
-# For every ISBN in the list of unique ISBNs, create a URL from the ISBN to search the catalog.
-# Search the HTML of the search result page. If the text "<a data-context-href="/catalog/" exists, there's a matching result.
-# Retrieve the catkey of the top result from the page. This gets saved to the catkeys list.
-# If the HTML text doesn't exist, there's no results found and the ISBN is added to the "ISBNs Not Found" list.
-
-count = 0       # Counter variable for indicating where the script is at in the list.
-
-# For every ISBN in the list of deduped ISBNs, print out it's index in the list. This serves as a status update message.
-for isbn in unique_isbns:
-    print("Processing item #" + str(unique_isbns.index(isbn)+1) + "/" + str(len(unique_isbns)))
-    # If the ISBN from the bookstore is blank or 0, then it's an error. We save these to a separate list to display to the user later on.
-    if(isbn == "" or isbn == 0 or isbn == "0"):
-        isbn_errors += 1
-    # If an ISBN is valid (not blank or 0), retrieve the HTML of the catalog search page associated with that ISBN.
-    else: 
-        isbn_search_url = catalog_url + "?search_field=all_fields&q=" + str(isbn)
-        r = requests.get(isbn_search_url)
-        page_text = r.text
-        # If an ISBN is found, retrieve the catkey from the page results. These will be used for the pull list.
-        if('<a data-context-href="/catalog/') in page_text: 
-            catkey = re.findall('catalog/(.*)counter=1', page_text)
-            catkey = re.sub('/track[?]', '', str(catkey))
-            catkey = re.sub('NCSU', '', catkey)
-            catkey = re.sub('[^A-Za-z0-9]', '', str(catkey))
-            catkeys.append(catkey)
-            bookstore_isbns_in_catalog.append(int(isbn))
+# Opens the catalog session that create_lists searches with: one CatalogClient (shared connections and rate limiting), with the catalog cache and
+# the offline index (if it has been built) of the Textbooks folder. Close it with close_catalog() when every list is done.
+# refresh_ahead_days re-checks cache entries that many days before they expire (see catalog_cache.py); the prefetch job uses it.
+def open_catalog(textbooks_dir=TEXTBOOKS_DIR, catalog_url=CATALOG_URL, max_catalog_searches=MAX_CATALOG_SEARCHES, search_backend=CATALOG_SEARCH_BACKEND,
+                 refresh_ahead_days=0):
+    # Cache of previous catalog lookups, shared by every semester. Found titles are re-checked after 30 days, titles not found after 3 days.
+    catalog_cache = CatalogCache(os.path.join(textbooks_dir, "catalog_cache.sqlite"), ttl_days=30, not_found_ttl_days=3, refresh_ahead_days=refresh_ahead_days)
+    # Offline index of ISBNs -> catkeys built from a bulk catalog export (see catalog_index.py). If it has been built, ISBNs are looked up there first,
+    # and only the ones it doesn't have are searched in the live catalog.
+    catalog_index_dir = os.path.join(textbooks_dir, "catalog_index")
+    catalog_index = CatalogIndex(catalog_index_dir) if os.path.exists(os.path.join(catalog_index_dir, "isbns.npy")) else None
+    return CatalogClient(catalog_url, max_concurrency=max_catalog_searches, cache=catalog_cache, index=catalog_index,
+                         search_backend=search_backend, batch_size=25)
+
+
+# evict=False leaves trimming the catalog cache to someone else (see run_batch).
+def close_catalog(catalog_client, evict=True):
+    catalog_client.close()
+    catalog_client.cache.close(evict=evict)
+
+
+# *********************************
+# Creating the Order and Pull Lists
+# *********************************
+
+# Creates the order list and pull list for one bookstore list (bkstr_file_name, without .xlsx) in the sem_folder semester folder, and returns the run report.
+# delta_mode only sends the rows that were added or changed since the last earlier bookstore list through the catalog (see delta.py). It falls back to a
+# full run if there's no earlier snapshot or if this bookstore list already has an order or pull list.
+# special_titles and catalog_client can be passed in to share them between lists; otherwise they're loaded/opened (and closed) just for this list.
+# Set extra_list_copies to ["csv"], ["parquet"], or both to also save copies of every sheet of the order and pull lists in those formats.
+# Set profile to True to also profile every stage with cProfile (the .prof files are saved next to the run report).
+def create_lists(sem_folder, bkstr_file_name, textbooks_dir=TEXTBOOKS_DIR, delta_mode=False, special_titles=None, catalog_client=None,
+                 extra_list_copies=(), profile=False):
+    # Set the start time before the script begins running.
+    start = time.time()
+    # Every stage of the script is timed, and every catalog request is measured. All of it is saved to a run report next to the order and pull lists.
+    run_metrics = RunMetrics(profile=profile)
+
+    sem_dir = semester_dir(sem_folder, textbooks_dir)
+
+    # Extract the date from the filename entered above - this will be used to later name the order and pull list files, so that they match the bookstore list date
+    bkstr_file_date = re.sub(" ", "", ((re.search('\s(.*)', bkstr_file_name)).group()))
+    bkstr_file_with_path = sem_dir + bkstr_file_name + ".xlsx"
+    order_list_name = 'order_list ' + bkstr_file_date + '.xlsx'
+    pull_list_name = 'pull_list ' + bkstr_file_date + '.xlsx'
+
+    prev_ord_lists, prev_pull_lists = previous_lists(sem_dir, own_lists=(order_list_name, pull_list_name))
+    print("\nThe following order and pull lists will be used to exclude titles that have already been ordered or previously pulled:\n")
+    print("\n".join(prev_ord_lists + prev_pull_lists))
+    print("\nNote: If this list is empty, no previous order lists for the " + sem_folder + " semester were found.")
+    print("If this is an error, make sure the previous order list exists, and verify it is named correctly (order_list [date]).\n")
+
+    # Delta mode: after every run, a snapshot of the processed bookstore list is saved in the semester folder (see delta.py). If an earlier bookstore list
+    # has one, only the rows that were added or changed since that list are sent through the catalog. Everything else was already handled by its run.
+    bkstr_snapshot_path = snapshot_path(sem_dir, bkstr_file_name)
+    earlier_snapshot = previous_snapshot(sem_dir, bkstr_file_name) if delta_mode else None
+    if delta_mode and earlier_snapshot is None:
+        print("Delta mode: no earlier bookstore list of this semester has a snapshot, so the whole list is processed.\n")
+    # Delta output only holds what changed, so it never replaces order or pull lists this bookstore list already has.
+    if earlier_snapshot is not None and (os.path.exists(sem_dir + order_list_name) or os.path.exists(sem_dir + pull_list_name)):
+        print("Delta mode: " + order_list_name + " or " + pull_list_name + " already exists, so the whole list is processed rather than replacing it with only the changes.\n")
+        earlier_snapshot = None
+    delta_mode = earlier_snapshot is not None
+
+    # **********************************
+    # Handling Previously Ordered and Pulled Titles
+    # **********************************
+
+    # Every ISBN is compared through its canonical key (see isbns.py), since the same ISBN can come back from a spreadsheet as an int, a float, or a string,
+    # and ISBN-10s lose their leading zeros. Keys are collected into sets, so checking whether an ISBN was seen before is a single lookup no matter how long the lists get.
+
+    # Retrieve ISBNs from previous order lists and pull lists, if they exist. These will be excluded from the bookstore list.
+    # Rather than opening every old workbook on every run, the ISBNs are kept in a ledger file in the semester folder (see ledger.py).
+    # Only workbooks that are new or have changed since the last run get read; everything else comes straight from the ledger.
+    run_metrics.stage("previous list exclusion")
+    list_ledger = ListLedger(sem_dir + "previous_lists_ledger.sqlite")
+    list_ledger.sync({"order": [sem_dir + file for file in prev_ord_lists],
+                      "pull": [sem_dir + file for file in prev_pull_lists]})
+    prev_ord_isbns = list_ledger.isbns("order")
+    prev_pull_isbns = list_ledger.isbns("pull")
+    list_ledger.close()
+
+    # Parsed copies of the bookstore list and SpecialTitles are kept in this folder (see workbooks.py), so re-running the script on the same bookstore list skips reading the Excel file.
+    sidecar_dir = os.path.join(textbooks_dir, "parquet_cache")
+
+    run_metrics.stage("workbook load")
+    # Create a dataframe from the "For database process" tab of the bookstore list. The canonical key of each row's ISBN-13 is computed once and kept in the "ISBN Key" column.
+    tb_df = read_sheets(bkstr_file_with_path, {'formatted for DB processing': BOOKSTORE_COLUMNS}, sidecar_dir=sidecar_dir)['formatted for DB processing'].fillna('')
+    tb_df["ISBN Key"] = canonical_isbns(tb_df["ISBN-13"])
+
+    # In delta mode, keep only the ISBNs that have new or changed rows compared to the last snapshot. All of the rows for those ISBNs are kept, so their course info stays complete.
+    # The full list is kept aside, since that's what the next snapshot is made from.
+    run_metrics.stage("previous list exclusion")
+    full_tb_df = tb_df
+    if delta_mode:
+        delta_isbns = changed_isbns(tb_df, BOOKSTORE_COLUMNS, earlier_snapshot[1])
+        tb_df = tb_df[tb_df["ISBN Key"].isin(delta_isbns)]
+        print("\nDelta mode: " + str(len(delta_isbns)) + " ISBN(s) have rows that were added or changed since " + earlier_snapshot[0] + ".")
+
+    # Remove ISBN matches of previous order lists from the current bookstore list. Do the same for previously pulled ISBNs.
+    tb_df = tb_df[~tb_df["ISBN Key"].isin(prev_ord_isbns | prev_pull_isbns)]
+
+    # The bookstore list has each section of a course listed separately, with repeating ISBNs. If multiple sections use the same book, it's confusing to display.
+    # So, every row's department, course, and section get merged into one "Dept Crs-Sect" text per ISBN, one line per section. This is done once here for the whole bookstore list
+    # with a single groupby, and both the order list and the pull list look their course info up in course_info_by_isbn.
+    run_metrics.stage("aggregation")
+    tb_df['Course Info'] = tb_df['Dept'].astype(str) + " " + tb_df['Crs'].astype(str) + "-" + tb_df['Sect'].astype(str)
+    course_info_by_isbn = tb_df.groupby("ISBN Key", sort=False)['Course Info'].agg('\n'.join).to_dict()
+
+    # Read the Special Titles spreadsheet (see load_special_titles), unless it was already read for an earlier list.
+    if special_titles is None:
+        run_metrics.stage("workbook load")
+        special_titles = load_special_titles(textbooks_dir)
+    excluded_isbns = special_titles.excluded_isbns
+
+    run_metrics.stage("replacement and exclusion matching")
+    # Create a list of deduped, unique ISBN keys from the bookstore data. A dict keeps them in the order they appear on the bookstore list, so every run processes them in the same order.
+    unique_isbns = dict.fromkeys(tb_df["ISBN Key"])
+
+    # Handling replacement titles.
+    bkstr_isbn_to_replace = []
+    final_replacement_isbn = []
+
+    # For every ISBN in the deduped bookstore ISBNs that has a replacement, save the pair to separate lists (following chained replacements, see SpecialTitles).
+    # Then, remove the matched ISBNs from the deduped bookstore ISBNs. This prevents the script from attempting to add ISBNs we have replacements for to the order list.
+    for isbn in list(unique_isbns):
+        if isbn in special_titles.replacement_isbns:
+            bkstr_isbn_to_replace.append(isbn)
+            final_replacement_isbn.append(special_titles.final_replacement(isbn))
+            del unique_isbns[isbn]
+
+    # The current bookstore list's ISBNs to replace, and the replaced ISBNs, will later become the "Replaced ISBNs" tab on the order list spreadsheet.
+    # We'll also use the final_replacement_isbn list and add those ISBNs to the pull list, and exclude them from the order list.
+
+    # The reverse of the pairs above: for every replacement ISBN, the bookstore ISBN it replaced. The pull list uses this to find the course info for a replacement title.
+    # If several bookstore ISBNs share one replacement, the first one on the bookstore list is used.
+    replaced_bookstore_isbns = {}
+    for bkstr_isbn, replacement in zip(bkstr_isbn_to_replace, final_replacement_isbn):
+        replaced_bookstore_isbns.setdefault(replacement, bkstr_isbn)
+
+    # *********************
+    # Searching the Catalog
+    # *********************
+
+    # Handling excluded titles. This creates a list of all matches between the deduped ISBNs and the ISBNs to exclude.
+    excl_matches = [isbn for isbn in unique_isbns if isbn in excluded_isbns]
+    for isbn in excl_matches:
+        del unique_isbns[isbn]
+
+    # Open the catalog session (see open_catalog), unless one was passed in to share between lists.
+    close_catalog_when_done = catalog_client is None
+    if catalog_client is None:
+        run_metrics.stage("catalog setup")
+        catalog_client = open_catalog(textbooks_dir)
+    catalog_cache = catalog_client.cache
+    # The cache's hit counts and the index hits are counted per bookstore list.
+    catalog_cache.reset_stats()
+    catalog_client.index_hits = 0
+    catalog_client.metrics = run_metrics
+    isbns_not_found = []                            # Contains a list of ISBNs not found in the search results.
+    isbn_errors = 0                                 # Bookstore rows whose ISBN = 0 or is blank. We'll count these up to save for later.
+                                                    # Specificed as bookstore ISBNs here, to differentiate from the list of all possible ISBNs found in the item's catalog entry.
+
+    # Add the replaced ISBNs to the list of deduped ISBNs from the bookstore. These will eventually make it to the pull list.
+    unique_isbns.update(dict.fromkeys(final_replacement_isbn))
+
+    # Status update messages. This script currently takes around 40 minutes to run on 1,200 items, so having status updates is helpful to note where the script is at in processing.
+    print("\n********************************************************************************************\nProcessing " + str(len(unique_isbns)) + " ISBNs.")
+    print(str(len(excl_matches)) + " ISBNs will be excluded. Check 'Excluded Titles' tab on the order list for details.")
+    print(str(len(prev_ord_isbns)) + " ISBNs were previously ordered. Check 'Previously Ordered' tab on the order list for details.")
+    print(str(len(prev_pull_isbns)) + " ISBNs were previously pulled. These will be excluded from the pull list.")
+    print("**********************************************************************************************\n")
+
+    # Detailed overview:
+    # For every ISBN in the list of unique ISBNs, create a URL from the ISBN to search the catalog.
+    # Search the HTML of the search result page. If the text "<a data-context-href="/catalog/" exists, there's a matching result.
+    # Retrieve the catkey of the top result from the page. Its record goes straight onto the pull list.
+    # If the HTML text doesn't exist, there's no results found and the ISBN is added to the "ISBNs Not Found" list.
+    # The searches run several at a time (see catalog.py), but the results come back in the same order as unique_isbns, so the lists match a one-at-a-time run.
+    # As soon as a search finds a catkey, the JSON for that catkey (used later for the pull list) starts downloading in the background, while the other searches keep going.
+
+    count = 0       # Counter variable for indicating where the script is at in the list.
+
+    # If the ISBN from the bookstore is blank or 0, then it's an error. We count the bookstore rows with these to display to the user later on. Every other ISBN gets searched.
+    isbn_errors = int((tb_df["ISBN Key"] == "").sum())
+    isbns_to_search = [isbn for isbn in unique_isbns if isbn != ""]
+
+    # ISBNs with a bad check digit are most likely typos on the bookstore list. They still get searched, but the user is told about them at the end
+    # (the first MAX_INVALID_ISBNS_SHOWN of them, so a long list doesn't flood the screen).
+    invalid_isbns = [isbn for isbn in isbns_to_search if not isbn13_is_valid(isbn)]
+
+    # Status update as the searches come back. Rather than a line for every item, one status line is updated about once a second.
+    print_search_progress = Progress("Processing item")
+
+    # Every search result is saved to a checkpoint file as soon as it comes back (see checkpoint.py). If this bookstore list was interrupted partway through
+    # the search last time, the ISBNs it already searched are picked up from the checkpoint instead of being searched again.
+    search_checkpoint = SearchCheckpoint(sem_dir + "search_checkpoint " + bkstr_file_name + ".jsonl")
+    already_searched = search_checkpoint.load()
+    if already_searched:
+        print("Resuming an interrupted run: " + str(len(already_searched)) + " ISBNs were already searched.\n")
+
+    # **********************
+    # Creating the Pull List
+    # **********************
+
+    # The pull list is written while the catalog is being searched: every item found goes straight into the spreadsheet (see writers.py), one row at a time,
+    # so the whole list never has to be held in memory.
+    pull_list_workbook = StreamingWorkbook(sem_dir + pull_list_name, extra_list_copies)
+    pull_list_sheet = pull_list_workbook.add_sheet('Pull List', PULL_LIST_COLUMNS, PULL_LIST_WIDTHS)
+
+    # # Compiled list of previously pulled catkeys.
+    # prev_pull_catkeys = []
+
+    # for file in prev_pull_lists:
+    #     temp_pull_df = pd.read_excel("G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\semesters\\" + sem_folder + "\\" + file, sheet_name='Pull List').fillna('')
+    #     prev_pull_catkeys.extend(temp_pull_df["Catkey"])
+
+    # # catkeys = [key for key in catkeys if key not in prev_pull_catkeys]
+
+    # For every ISBN, the search result comes back (in order) together with the catalog record for its catkey. The record's pull list fields are pulled out
+    # in the download threads (see PullRecord in records.py), once per catkey, even if several bookstore ISBNs point to it.
+    run_metrics.stage("catalog search and record fetch")
+    for isbn, catkey, pull_record in catalog_client.search_and_fetch_iter(isbns_to_search, progress=print_search_progress, known=already_searched,
+                                                                          on_search=search_checkpoint.record, transform=PullRecord):
+        # If an ISBN is found, add it to the pull list.
+        # This matches department/course/section information to each catalog item. This essentially does a "one to many" match - one textbook, multiple course matches.
+        # For ISBNs in the bookstore list that had adequate replacements in the catalog (identified via Special Titles spreadsheet), these ISBNs will need to be replaced with the bookstore ISBN.
+        # Otherwise, there's no way to match the bookstore's dept/crs/sect information to the new ISBN. So, we go back to replaced_bookstore_isbns to retrieve the original ISBN for every replacement ISBN.
+        # These original ISBNs are what's used to get the bookstore data for dept/crs/sect info (course_info_by_isbn). The pull list displays the original ISBN.
+        if catkey is not None:
+            bookstore_isbn = replaced_bookstore_isbns.get(isbn, isbn)
+            pull_list_sheet.write_row(pull_record.row(course_info_by_isbn.get(bookstore_isbn, ""), catkey, bookstore_isbn))
             count = count+1
         # If no ISBN is found, we don't own it. Add that ISBN to the list of ISBNs not found. These will be used for the order list.
         else:
-            isbns_not_found.append(int(isbn))
+            isbns_not_found.append(isbn)
+    search_checkpoint.close()
+    if catalog_client.index is not None:
+        print("\n" + str(catalog_client.index_hits) + " ISBNs were found in the offline catalog index.")
+
+    run_metrics.stage("export")
+    print("\nExporting pull list to " + sem_folder + " folder...")
+    pull_list_workbook.close()
+
+    # More status updates. Produces the number of items found in the catalog and the number of items not found in the catalog.
+    print("\n******************************\n" + str(count) + " items found in catalog.")
+    print(str(len(isbns_not_found)) + " items not found in catalog.\n******************************\n")
+
+    # ***********************
+    # Creating the Order List
+    # ***********************
+
+    print("Creating order list...")
+    run_metrics.stage("aggregation")
+
+    # Creates the order list. This part is really straightforward: just match the ISBNs Not Found back to the ISBNs in the bookstore list, and export it as a spreadsheet.
+    # Create a new dataframe that matches on ISBN-13s. If the ISBN-13 in the bookstore list is found in the list of ISBNs not found, save that information to this new dataframe.
+    order_df = tb_df[tb_df['ISBN Key'].isin(set(isbns_not_found))]
+    # Since the order list dataframe is a direct copy of the bookstore dataframe, we need to drop the irrelevant columns.if {'Dept', 'Crs', 'Sect', 'Est Enr', 'Stat', 'ISBN-10', 'Last Used', 'List_New', 'Net_New', 'List_Used', 'Net_Used', 'Copyright', 'Date', 'Instructor'}.issubset(tb_df.columns)
+    order_df = order_df.drop(['Dept', 'Crs', 'Sect', 'Est Enr', 'Stat', 'ISBN-10', 'Last Used', 'List_New', 'Net_New', 'List_Used', 'Net_Used', 'Copyright', 'Date', 'Instructor', 'Book Status'], axis=1, errors='ignore')
+    order_df = order_df.drop_duplicates(keep='first', subset='ISBN Key')
+    # The ISBN-13 column is written out as the canonical key, so it's always a 13-digit string no matter how the bookstore list stored it.
+    order_df["ISBN-13"] = order_df["ISBN Key"]
+
+    # This adds the merged department, course, and section information (see course_info_by_isbn above), so that multiple sections of the same course are matched to only one ISBN.
+    # It displays per ISBN rather than per course.
+    dept_crs_sect = [course_info_by_isbn[isbn] for isbn in order_df["ISBN Key"]]
+    order_df.insert(loc=1, column='Dept Crs-Sect', value=dept_crs_sect)
+
+    # Filepath for output
+    run_metrics.stage("export")
+    print("\nExporting order list to " + sem_folder + " folder...")
+
+    # Reorder the dataframe if things got out of place.
+    order_df = order_df.reindex(columns=['Term', 'Dept Crs-Sect', 'Author', 'Binding', 'Title', 'ISBN-13', 'Edition'])
+
+    # Export the order list to an Excel spreadsheet, written row by row just like the pull list. The first sheet is named Order List, followed by the
+    # Replaced Titles, Excluded Titles, and Previously Ordered Titles sheets, which are written straight from their lists.
+    with StreamingWorkbook(sem_dir + order_list_name, extra_list_copies) as order_list_workbook:
+        # Current Order List
+        order_list_workbook.add_frame('Order List', order_df, ORDER_LIST_WIDTHS)
+        # Replaced Titles
+        replaced_sheet = order_list_workbook.add_sheet('Replaced Titles', ['Bookstore ISBNs to Replace', 'Replacement ISBNs'],
+                                                       [('A:A', 25),            # bookstore isbn
+                                                        ('B:B', 25)])           # catalog isbn to replace bookstore isbn with
+        replaced_sheet.write_rows(zip(bkstr_isbn_to_replace, final_replacement_isbn))
+        # Excluded Titles
+        excluded_sheet = order_list_workbook.add_sheet('Excluded Titles', ['Bookstore ISBNs to Exclude'],
+                                                       [('A:A', 25)])           # bookstore isbn excluded from list
+        excluded_sheet.write_rows((isbn,) for isbn in excl_matches)
+        # Previously Ordered Titles
+        prev_ord_sheet = order_list_workbook.add_sheet('Previously Ordered Titles', ['Previously Ordered ISBNs'],
+                                                       [('A:A', 30),            # previously ordered ISBN
+                                                        ('B:B', 50),            # previously ordered title
+                                                        ('C:C', 15)])           # previously ordered author
+        prev_ord_sheet.write_rows((isbn,) for isbn in sorted(prev_ord_isbns))
+
+    # Both lists are written, so this bookstore list is done: save its snapshot for delta mode next time, and remove the search checkpoint.
+    save_snapshot(full_tb_df, BOOKSTORE_COLUMNS, bkstr_snapshot_path)
+    search_checkpoint.remove()
+    run_metrics.stop()
+
+    # *******************************************
+    # Closing: Time Elapsed
+    # *******************************************
+
+    # Gives time elapsed since the script first started running.
+    end = time.time()
+    time_elapsed = round((end-start)/60)
+    print("\nExecution time: " + str(time_elapsed) + " minutes.")
+    # Time spent in each stage of the script (the full breakdown, including catalog request latencies, is in the run report).
+    for stage, seconds in run_metrics.stages.items():
+        print("    " + stage + ": " + str(round(seconds, 1)) + "s")
+    print(str(isbn_errors) + " row(s) of the original bookstore list have a blank or 0 ISBN.")
+    if invalid_isbns:
+        shown = ", ".join(invalid_isbns[:MAX_INVALID_ISBNS_SHOWN])
+        if len(invalid_isbns) > MAX_INVALID_ISBNS_SHOWN:
+            shown += ", and " + str(len(invalid_isbns) - MAX_INVALID_ISBNS_SHOWN) + " more (see invalid_isbns in the run report)"
+        print(str(len(invalid_isbns)) + " ISBN(s) with an invalid check digit were searched anyway: " + shown)
+    print("\nIf there are any ISBNs caught in error, check the bookstore list for any empty or invalid ISBNs.")
+
+    # Cache hit rates: how many searches and item records were answered locally instead of being downloaded from the catalog again.
+    print("\nCatalog cache hit rate: " + str(round(catalog_cache.hit_rate("searches")*100)) + "% of ISBN searches, " + str(round(catalog_cache.hit_rate("records")*100)) + "% of item records.")
+
+    # Save the run report: how long every stage took, catalog request latencies/retries/bytes, and cache hit rates (see metrics.py).
+    run_report_path = sem_dir + "run_report " + bkstr_file_date + ".json"
+    run_report = run_metrics.write_report(run_report_path, cache=catalog_cache, semester=sem_folder, bookstore_list=bkstr_file_name, delta_mode=delta_mode,
+                                          bookstore_rows=len(full_tb_df), isbns_searched=len(isbns_to_search), items_found=count, items_not_found=len(isbns_not_found),
+                                          isbn_error_rows=isbn_errors, invalid_isbns=invalid_isbns,
+                                          index_hits=catalog_client.index_hits, search_backend=catalog_client.search_backend, max_concurrency=catalog_client.max_concurrency)
+    print("Run report saved to " + run_report_path)
+    catalog_client.metrics = None
+    if close_catalog_when_done:
+        close_catalog(catalog_client)
+    return run_report
+
+
+# ***********
+# Batch Mode
+# ***********
+
+# Groups (semester, bookstore list) jobs by semester, keeping the order they were given in. Lists of the same semester always run one after the other,
+# since every list's order and pull lists are "previous lists" for the next one.
+def _jobs_by_semester(jobs):
+    by_semester = {}
+    for sem_folder, bkstr_file_name in jobs:
+        by_semester.setdefault(sem_folder, []).append(bkstr_file_name)
+    return list(by_semester.items())
+
+
+# What every worker process of a batch needs, handed over once when the process starts.
+_worker = {}
+
+
+def _start_worker(textbooks_dir, special_titles, catalog_settings, list_options):
+    _worker.update(textbooks_dir=textbooks_dir, special_titles=special_titles, catalog_settings=catalog_settings, list_options=list_options)
+
+
+# Runs every list of one semester in a worker process, with one catalog session for all of them. The session is closed when the semester is done;
+# the cache isn't trimmed here, since the other workers are still using it (run_batch trims it once at the end).
+def _run_semester(semester_jobs):
+    sem_folder, bkstr_file_names = semester_jobs
+    catalog_client = open_catalog(_worker["textbooks_dir"], **_worker["catalog_settings"])
+    try:
+        return [create_lists(sem_folder, bkstr_file_name, _worker["textbooks_dir"], special_titles=_worker["special_titles"],
+                             catalog_client=catalog_client, **_worker["list_options"]) for bkstr_file_name in bkstr_file_names]
+    finally:
+        close_catalog(catalog_client, evict=False)
+
+
+# Creates the order and pull lists for every (semester, bookstore list) in jobs, in one process: SpecialTitles is read once, and one catalog session
+# (connections, cache, offline index) is used for every list, so titles looked up for one list are already cached for the next.
+# With processes > 1, the semesters are split over that many worker processes. SpecialTitles is still read only once; each worker opens a catalog
+# session per semester, and they all share the catalog cache file. Returns the run reports, in the order of jobs within each semester.
+# list_options are passed on to create_lists (delta_mode, extra_list_copies, profile).
+def run_batch(jobs, textbooks_dir=TEXTBOOKS_DIR, processes=1, catalog_settings=None, **list_options):
+    catalog_settings = catalog_settings or {}
+    special_titles = load_special_titles(textbooks_dir)
+    semesters = _jobs_by_semester(jobs)
+    if processes <= 1 or len(semesters) == 1:
+        catalog_client = open_catalog(textbooks_dir, **catalog_settings)
+        try:
+            return [create_lists(sem_folder, bkstr_file_name, textbooks_dir, special_titles=special_titles, catalog_client=catalog_client, **list_options)
+                    for sem_folder, bkstr_file_names in semesters for bkstr_file_name in bkstr_file_names]
+        finally:
+            close_catalog(catalog_client)
+    with ProcessPoolExecutor(max_workers=min(processes, len(semesters)), initializer=_start_worker,
+                             initargs=(textbooks_dir, special_titles, catalog_settings, list_options)) as executor:
+        run_reports = [run_report for semester_reports in executor.map(_run_semester, semesters) for run_report in semester_reports]
+    # Every worker is done with the cache, so it's trimmed (see CatalogCache.evict) once, here.
+    catalog_cache = CatalogCache(os.path.join(textbooks_dir, "catalog_cache.sqlite"))
+    try:
+        catalog_cache.evict()
+    finally:
+        catalog_cache.close(evict=False)
+    return run_reports
 
-# More status updates. Produces the number of items found in the catalog and the number of items not found in the catalog.
-print("\n******************************\n" + str(count) + " items found in catalog.")
-print(str(len(isbns_not_found)) + " items not found in catalog.\n******************************\n")
 
 # ***********************
-# Creating the Order List
+# User Input
 # ***********************
 
-print("Creating order list...")
-
-# Creates the order list. This part is really straightforward: just match the ISBNs Not Found back to the ISBNs in the bookstore list, and export it as a spreadsheet.
-# Create a new dataframe that matches on ISBN-13s. If the ISBN-13 in the bookstore list is found in the list of ISBNs not found, save that information to this new dataframe.
-order_df = tb_df[tb_df['ISBN-13'].isin(isbns_not_found)]
-# Since the order list dataframe is a direct copy of the bookstore dataframe, we need to drop the irrelevant columns.if {'Dept', 'Crs', 'Sect', 'Est Enr', 'Stat', 'ISBN-10', 'Last Used', 'List_New', 'Net_New', 'List_Used', 'Net_Used', 'Copyright', 'Date', 'Instructor'}.issubset(tb_df.columns)
-order_df = order_df.drop(['Dept', 'Crs', 'Sect', 'Est Enr', 'Stat', 'ISBN-10', 'Last Used', 'List_New', 'Net_New', 'List_Used', 'Net_Used', 'Copyright', 'Date', 'Instructor', 'Book Status'], axis=1, errors='ignore')
-order_df = order_df.drop_duplicates(keep='first', subset='ISBN-13')
-# Not sure why, but for whatever reason, ISBNs first need to be converted to int64, and then saved as a string. It's a little clunky, but it works.
-order_df["ISBN-13"] = order_df["ISBN-13"].astype('int64')
-order_df["ISBN-13"] = order_df["ISBN-13"].astype(str)
-
-# This merges the department, course, and section information into one column, pulling from dept/crs/sect of the original bookstore list. 
-# The bookstore list has each section of a course listed separately, with repeating ISBNs. If multiple sections use the same book, it's confusing to display.
-# This below uses ISBN as the key, and flattens all results that match that ISBN. That way, multiple sections of the same course are matched to only one ISBN. It displays per ISBN rather than per course.
-dept_crs_sect = [] 
-for isbn in order_df["ISBN-13"]:
-    filtered_isbns_tb_df = tb_df[tb_df['ISBN-13'] == int(isbn)]
-    filtered_isbns_tb_df['Course Info'] = filtered_isbns_tb_df['Dept'] + " " + filtered_isbns_tb_df['Crs'].astype(str) + "-" + filtered_isbns_tb_df['Sect'].astype(str)
-    course_info = list(filtered_isbns_tb_df['Course Info'])
-    dept_crs_sect.append('\n'.join(course_info))
-order_df.insert(loc=1, column='Dept Crs-Sect', value=dept_crs_sect)
-
-# Filepath for output
-print("\nExporting order list to " + sem_folder + " folder...")
-
-# Reorder the dataframe if things got out of place.
-order_df = order_df.reindex(columns=['Term', 'Dept Crs-Sect', 'Author', 'Binding', 'Title', 'ISBN-13', 'Edition'])
-
-# Export the dataframe to an Excel spreadsheet. The sheet is named Order List, and the cells are formatted to have text wrapping and specific column widths for readability purposes.
-with pd.ExcelWriter("G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\semesters\\" + sem_folder + "\\" + 'order_list ' + bkstr_file_date + '.xlsx', engine='xlsxwriter') as writer:
-    # Current Order List
-    order_df.to_excel(writer, sheet_name='Order List', index=False, na_rep='Nan')
-    workbook = writer.book
-    worksheet = writer.sheets['Order List']
-    # This cell_format is applied to all of the cells in the spreadsheet(s): allow for text wrapping and vertically align the text to the top of each cell.
-    cell_format = workbook.add_format({'text_wrap': True, 'valign': 'top'})
-    # Order List
-    worksheet.set_column('A:A', 5, cell_format=cell_format)     # term
-    worksheet.set_column('B:B', 15, cell_format=cell_format)    # dept crs-sect
-    worksheet.set_column('C:C', 30, cell_format=cell_format)    # author
-    worksheet.set_column('D:D', 15, cell_format=cell_format)    # cover
-    worksheet.set_column('E:E', 60, cell_format=cell_format)    # title
-    worksheet.set_column('F:F', 15, cell_format=cell_format)    # isbn-13
-    worksheet.set_column('G:G', 15, cell_format=cell_format)    # edition
-    # Replaced Titles
-    final_replacements_df.to_excel(writer, sheet_name='Replaced Titles', index=False, na_rep='Nan')
-    worksheet = writer.sheets['Replaced Titles']
-    worksheet.set_column('A:A', 25, cell_format=cell_format)    # bookstore isbn
-    worksheet.set_column('B:B', 25, cell_format=cell_format)    # catalog isbn to replace bookstore isbn with
-    # Excluded Titles
-    final_exclusions_df.to_excel(writer, sheet_name='Excluded Titles', index=False, na_rep='Nan')
-    worksheet = writer.sheets['Excluded Titles']                
-    worksheet.set_column('A:A', 25, cell_format=cell_format)    # bookstore isbn excluded from list
-    # Previously Ordered Titles
-    prev_ord_df.to_excel(writer, sheet_name='Previously Ordered Titles', index=False, na_rep='Nan')
-    worksheet = writer.sheets['Previously Ordered Titles']
-    worksheet.set_column('A:A', 30, cell_format=cell_format)    # previously ordered ISBN
-    worksheet.set_column('B:B', 50, cell_format=cell_format)    # previously ordered title
-    worksheet.set_column('C:C', 15, cell_format=cell_format)    # previously ordered author
-
-# **********************
-# Creating the Pull List
-# **********************
-
-# Now for the pull list. Create empty lists for each column of the pull list. These columns will be populated using the catalog API.
-all_isbns, titles, authors, editions, pub_years, item_locations, types, call_numbers, restriction_notes, barcode = [], [], [], [], [], [], [], [], [], []
-
-# Status update that the catalog API is being scraped.
-print("\nScanning the catalog for bibliographic information for pull list...\n")
-# These lists are a little different from the ones above, since they'll all be merged into dept_crs_sect. Separating them here is just for readability to understand the code 
-# a little better.
-dept_crs_sect, dept, crs, sect = [], [], [], []         
-
-# This loop merges department/course/section information into one cell per catalog item. This essentially does a "one to many" match - one textbook, multiple course matches.
-# For every ISBN in the list of ISBNs identified in the catalog, match these ISBNs back to what's in the bookstore list to retrieve the course/dept/sect for that ISBN.
-# For ISBNs in the bookstore list that had adequate replacements in the catalog (identified via Special Titles spreadsheet), these ISBNs will need to be temporarily replaced with the bookstore ISBN.
-# Otherwise, there's no way to match the bookstore's dept/crs/sect information to the new ISBN. So, we go back to our key-value pairs to retrieve the original ISBN for every replacement ISBN.
-# These original ISBNs are what's used to get the bookstore data for dept/crs/sect info. All of this later gets sent to the pull list with the original and replaced ISBN displayed.
-bookstore_isbns_in_catalog = [str(isbn).zfill(10) if len(str(isbn)) < 10 else str(isbn) for isbn in bookstore_isbns_in_catalog]
-for isbn in bookstore_isbns_in_catalog:
-    # Note: Write a function for the next two if-elif statements.
-    if isbn in replacement_isbns.values():
-        key_list = list(replacement_isbns.keys())
-        val_list = list(replacement_isbns.values())
-        old_isbn = key_list[val_list.index(isbn)]
-        bookstore_isbns_in_catalog[bookstore_isbns_in_catalog.index(isbn)] = old_isbn
-        isbn = old_isbn
-    filtered_isbns_tb_df = tb_df[tb_df['ISBN-13'] == int(isbn)]
-    filtered_isbns_tb_df['Course Info'] = filtered_isbns_tb_df['Dept'] + " " + filtered_isbns_tb_df['Crs'].astype(str) + "-" + filtered_isbns_tb_df['Sect'].astype(str)
-    course_info = list(filtered_isbns_tb_df['Course Info'])
-    dept_crs_sect.append('\n'.join(course_info))
-
-# Create lists for item locations and barcodes.
-locations_list = []
-bcodes = []
-# Counter for status updates.
-count = 0
-
-# This function handles cases where the JSON for a certain item is missing.
-def handle_missing_json(element, json_var):
-    if element in json_var:
-        return(json_var[element])
-    else:
-        return ""
-
-# # Compiled list of previously pulled catkeys.    
-# prev_pull_catkeys = []
-
-# for file in prev_pull_lists:
-#     temp_pull_df = pd.read_excel("G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\semesters\\" + sem_folder + "\\" + file, sheet_name='Pull List').fillna('')
-#     prev_pull_catkeys.extend(temp_pull_df["Catkey"])
-
-# # catkeys = [key for key in catkeys if key not in prev_pull_catkeys]
-
-# Detailed overview:
-# For every catkey in the list of catkeys we scraped from the catalog earlier, scrape the JSON for that catkey.
-# Capture all of the needed information for the pull list, and save each field into its own list.
-# Give a status update at the end that shows what number in the list we're currently processing.
-for catkey in catkeys:
-    item_url = catalog_url + "/catalog/NCSU" + str(catkey) + ".json"
-    r = requests.get(item_url)
-    if r.status_code != 204 or r.status_code != 404:
-        item_json = r.json()
-        isbns = '\n'.join(handle_missing_json("isbn", item_json))
-        all_isbns.append(isbns)
-        titles.append(handle_missing_json("title", item_json))
-        authors.append(handle_missing_json("statement_of_responsibility", item_json))
-        editions.append(handle_missing_json("edition", item_json))
-        pub_years.append(handle_missing_json("publication_year", item_json))
-        locations = handle_missing_json("locations", item_json)
-        # Handles multiple locations of a single catalog item.
-        for loc in locations:
-            locations_list.append(loc['library']['display'])
-            locations_list.append("-")
-            locations_list.append(loc['location']['display'])
-            locations_list.append("\n")
-        item_locations.append(' '.join(locations_list))
-        locations_list = []
-        call_num = handle_missing_json("call_number", item_json)
-        call_numbers.append(call_num)
-        # Handles ebook vs physical titles.
-        if "ebook" in call_num:
-            types.append("eBook")
-        else:
-            type = re.sub('[^A-Za-z0-9\s]', '', str(handle_missing_json("type", item_json)))
-            types.append(type)
-        item_info = handle_missing_json("items", item_json)
-        # Handles multiple barcodes for a single catalog item.
-        if item_info != "":
-            for elem in item_info:
-                bcode_list = re.findall("'item_id': '(.*)', 'loc", str(elem))
-                for code in bcode_list:
-                    bcode = re.sub(", '(.*)", '', str(code))
-                    bcode = re.sub('[^A-Za-z0-9\s]', '', str(bcode))
-                    bcodes.append(bcode)
-            barcode_list = '\n'.join([str(item) for item in bcodes])
-            bcodes=[]
-            barcode.append(barcode_list)
-        else:
-            barcode.append("")
-        restriction_notes.append(handle_missing_json("access_restrictions", item_json))
-        count = count+1
-    print("Formatting item " + str(count) + "/" + str(len(catkeys)))
-
-# Create a spreadsheet from the data and export that data to the user's desktop. 
-print("\nExporting pull list to " + sem_folder + " folder...")
-catkey_isbn_df = pd.DataFrame(list(zip(dept_crs_sect, catkeys, titles, authors, item_locations, call_numbers, types, bookstore_isbns_in_catalog, all_isbns, editions, pub_years, barcode, restriction_notes)),
-                              columns=['Dept Crs-Sect', 'Catkey', 'Title', 'Author', 'Item Location', 'Call Number', 'Item Type', 'Bookstore ISBN', 'All ISBNs', 'Edition', 'Year', 'Barcodes', 'Access Restrictions'])
-catkey_isbn_df["Bookstore ISBN"] = catkey_isbn_df["Bookstore ISBN"].astype('int64')
-catkey_isbn_df["Bookstore ISBN"] = catkey_isbn_df["Bookstore ISBN"].astype(str)
-
-# Just like with the order list, format the pull list into an Excel spreadsheet.
-with pd.ExcelWriter("G:\Acquisitions & Discovery\Data Projects & Partnerships Unit\Textbooks\semesters\\" + sem_folder + "\\" + 'pull_list ' + bkstr_file_date + '.xlsx', engine='xlsxwriter') as writer:
-    catkey_isbn_df.to_excel(writer, sheet_name='Pull List', index=False, na_rep='Nan')
-    workbook = writer.book
-    worksheet = writer.sheets['Pull List']
-    # Formatting columns to have top vertical alignment, text wrapping, and appropriate width.
-    cell_format = workbook.add_format({'text_wrap': True, 'valign': 'top'})
-    worksheet.set_column('A:A', 12, cell_format=cell_format)        # dept course-sect
-    worksheet.set_column('B:B', 10, cell_format=cell_format)        # catkeys
-    worksheet.set_column('C:D', 45, cell_format=cell_format)        # title and author
-    worksheet.set_column('E:E', 35, cell_format=cell_format)        # item location
-    worksheet.set_column('F:F', 20, cell_format=cell_format)        # call number
-    worksheet.set_column('G:G', 10, cell_format=cell_format)        # item type
-    worksheet.set_column('H:H', 15, cell_format=cell_format)        # bookstore ISBN
-    worksheet.set_column('I:I', 15, cell_format=cell_format)        # all ISBNs
-    worksheet.set_column('J:J', 10, cell_format=cell_format)        # edition
-    worksheet.set_column('K:K', 5, cell_format=cell_format)         # year published
-    worksheet.set_column('L:L', 15, cell_format=cell_format)        # barcodes
-    worksheet.set_column('M:M', 20, cell_format=cell_format)        # access restrictions
-
-# *******************************************
-# Closing: Time Elapsed and File Notification
-# *******************************************
-
-# Gives time elapsed since the script first started running.
-end = time.time()
-time_elapsed = round((end-start)/60)
-print("\nExecution time: " + str(time_elapsed) + " minutes.")
-print(str(isbn_errors) + " ISBN(s) error from the original bookstore list.")
-print("\nIf there are any ISBNs caught in error, check the bookstore list for any empty or invalid ISBNs.")
-
-# Opens the folder location of the exported order/pull lists if user requested to be notified when the script is done.
-# if notify_user == "yes":
-#     path = sem_file_path
-#     path = os.path.realpath(path)
-#     os.startfile(path)
\ No newline at end of file
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create the order list and pull list for one or more bookstore lists. "
+                                                 "Anything not given on the command line is asked for.")
+    parser.add_argument("semester", nargs="?", help='Semester folder, e.g. "Fall 2023" (case-sensitive).')
+    parser.add_argument("bookstore_lists", nargs="*", help='Bookstore list name(s) without .xlsx, e.g. "FallBookstoreList 9-8-2023" (case-sensitive).')
+    parser.add_argument("--job", action="append", default=[], metavar="SEMESTER/BOOKSTORE_LIST",
+                        help='A bookstore list of any semester, e.g. "Spring 2024/SpringBookstoreList 1-5-2024". Can be repeated.')
+    parser.add_argument("--root", default=TEXTBOOKS_DIR, help="The Textbooks folder (default: the one on the G:/ drive).")
+    parser.add_argument("--delta", action="store_true", help="Only process titles added or changed since the last bookstore list of the semester.")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes for batches with several semesters.")
+    parser.add_argument("--copies", nargs="*", default=[], choices=["csv", "parquet"], help="Also save the lists in these formats.")
+    parser.add_argument("--catalog-url", default=CATALOG_URL)
+    parser.add_argument("--max-searches", type=int, default=MAX_CATALOG_SEARCHES, help="Maximum number of catalog searches running at the same time.")
+    parser.add_argument("--search-backend", default=CATALOG_SEARCH_BACKEND, choices=["json", "html"])
+    parser.add_argument("--profile", action="store_true", help="Profile every stage with cProfile (saved next to the run report).")
+    args = parser.parse_args(argv)
+
+    delta_mode = args.delta
+    jobs = [tuple(job.rsplit("/", 1)) for job in args.job]
+    if any(len(job) != 2 for job in jobs):
+        parser.error('--job needs a semester and a bookstore list, e.g. "Fall 2023/FallBookstoreList 9-8-2023".')
+
+    if not jobs or args.semester is not None:
+        # Retrieve semester from user. This is then used to isolate the semester so we can create a directory path to the relevant files. We also save a list of all the files
+        # beginning with the semester name so that we can display them to the user. This prevents having to open the file explorer to get the exact file name.
+        sem_folder = args.semester
+        if sem_folder is None:
+            sem_folder = input("Enter the semester in [semester] [year] format (ex: Fall 2023). Note: this is case-sensitive!\n")
+        bkstr_file_names = args.bookstore_lists
+        if not bkstr_file_names:
+            # Display the possible bookstore list options to the user. Then, retrieve exact bookstore list file name from user.
+            print("\nBookstore lists in this directory:\n")
+            print("\n".join(bookstore_list_options(sem_folder, args.root)))
+            bkstr_file_names = [input("\nEnter the full name of the bookstore list spreadsheet (ex: FallBookstoreList 9-8-2023). Note: this is case-sensitive!\n")]
+            # If an earlier bookstore list of the semester has a snapshot (see delta.py), ask whether to only process what changed since that list.
+            earlier_snapshot = previous_snapshot(semester_dir(sem_folder, args.root), bkstr_file_names[0]) if not delta_mode else None
+            if earlier_snapshot is not None:
+                delta_mode = input("\nA snapshot of the earlier bookstore list " + earlier_snapshot[0] + " was found. Only process titles that were added or changed since then? Type yes or no below.\n").lower() == "yes"
+        jobs = [(sem_folder, bkstr_file_name) for bkstr_file_name in bkstr_file_names] + jobs
+
+    # Ask if user would like to be notified when script is done running. By default, the notification will assume no.
+    # If the user selects yes, the script will automatically open the file folder of the exported pull/order lists.
+    # notify_user = input("Would you like to be notified when the script is done running? The script will automatically open to the location of the order and pull lists upon completion. \nType yes or no below.\n").lower()
+    # if notify_user != ("yes" or "no"):  notify_user == "no"
+
+    catalog_settings = {"catalog_url": args.catalog_url, "max_catalog_searches": args.max_searches, "search_backend": args.search_backend}
+    run_reports = run_batch(jobs, args.root, processes=args.processes, catalog_settings=catalog_settings,
+                            delta_mode=delta_mode, extra_list_copies=args.copies, profile=args.profile)
+    if len(run_reports) > 1:
+        print("\n" + str(len(run_reports)) + " bookstore lists done:")
+        for run_report in run_reports:
+            print("    " + run_report["semester"] + " / " + run_report["bookstore_list"] + ": " + str(run_report["items_found"]) + " found, "
+                  + str(run_report["items_not_found"]) + " to order (" + str(round(run_report["total_seconds"])) + "s)")
+
+    # Opens the folder location of the exported order/pull lists if user requested to be notified when the script is done.
+    # if notify_user == "yes":
+    #     path = sem_file_path
+    #     path = os.path.realpath(path)
+    #     os.startfile(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# This module warms up the catalog cache (see catalog_cache.py) ahead of time, so that when a new bookstore list comes in, order_pull_lists.py finds
+# almost every title in the cache and finishes in seconds instead of spending most of its time searching the catalog.
+# It's meant to run on its own schedule, for example nightly:
+#   python prefetch.py [--root <Textbooks folder>] [--refresh-ahead-days 7] [--limit 20000]
+#
+# What gets warmed, most reused titles first:
+#   - ISBNs from every bookstore list in every semester folder. An ISBN's score is the number of semesters it was assigned in, since titles that come back
+#     semester after semester are the ones the next bookstore list is most likely to have.
+#   - SpecialTitles replacement ISBNs. These are searched instead of the bookstore ISBN they replace, so they take over its score (plus one, since they're
+#     searched every time that bookstore ISBN shows up). Replaced and excluded bookstore ISBNs are never searched, so they're skipped.
+#   - Catkeys from existing pull lists, whose item records are warmed as well (scored by the number of pull lists they're on).
+# Searching an ISBN also fetches the record of the catkey it finds. Entries that are still fresh are skipped, except ones that will expire within
+# refresh_ahead_days, which are re-checked now (usually a cheap 304) so they're still fresh for the next run. Not-found results only last a few days,
+# so those are always re-checked.
+
+import argparse
+import os
+import time
+
+from catalog_index import clean_catkey
+from isbns import canonical_isbns
+from metrics import Progress, RunMetrics
+from order_pull_lists import BOOKSTORE_COLUMNS, CATALOG_URL, MAX_CATALOG_SEARCHES, TEXTBOOKS_DIR, bookstore_list_options, close_catalog, load_special_titles, open_catalog, semester_dir
+from workbooks import read_sheets
+
+
+# Reads one sheet of a workbook, or returns None (with a note) if the workbook can't be read, so one odd old file doesn't stop the whole prefetch.
+def _read_sheet(path, sheet, columns, sidecar_dir):
+    try:
+        return read_sheets(path, {sheet: columns}, sidecar_dir=sidecar_dir)[sheet]
+    except (OSError, ValueError, KeyError) as error:
+        print("Note: skipping " + os.path.basename(path) + " (" + str(error) + ").")
+        return None
+
+
+# Scores every ISBN on the bookstore lists, and every catkey on the pull lists, of every semester folder.
+# Returns (isbn_scores, catkey_scores): dicts of ISBN key / catkey -> score, in the order they were first seen.
+def reuse_counts(textbooks_dir=TEXTBOOKS_DIR):
+    sidecar_dir = os.path.join(textbooks_dir, "parquet_cache")
+    isbn_scores = {}
+    catkey_scores = {}
+    semesters_dir = os.path.join(textbooks_dir, "semesters")
+    for sem_folder in sorted(os.listdir(semesters_dir)):
+        sem_dir = semester_dir(sem_folder, textbooks_dir)
+        if not os.path.isdir(sem_dir):
+            continue
+        semester_isbns = set()
+        for bkstr_file_name in bookstore_list_options(sem_folder, textbooks_dir):
+            tb_df = _read_sheet(sem_dir + bkstr_file_name + ".xlsx", 'formatted for DB processing', BOOKSTORE_COLUMNS, sidecar_dir)
+            if tb_df is not None and "ISBN-13" in tb_df.columns:
+                semester_isbns.update(canonical_isbns(tb_df["ISBN-13"]))
+        semester_isbns.discard("")
+        for isbn in semester_isbns:
+            isbn_scores[isbn] = isbn_scores.get(isbn, 0) + 1
+        for file in sorted(os.listdir(sem_dir)):
+            if file.startswith("pull_list") and file.endswith(".xlsx"):
+                pull_df = _read_sheet(sem_dir + file, 'Pull List', ['Catkey'], sidecar_dir)
+                if pull_df is not None and "Catkey" in pull_df.columns:
+                    for catkey in set(clean_catkey(value) for value in pull_df["Catkey"].dropna()) - {""}:
+                        catkey_scores[catkey] = catkey_scores.get(catkey, 0) + 1
+    return isbn_scores, catkey_scores
+
+
+# The ISBNs order_pull_lists.py would search for these bookstore ISBNs: replaced ISBNs become their (final) replacement, which takes over their score,
+# and excluded ISBNs are dropped. Returns a list of ISBNs, highest score first.
+def isbns_to_warm(isbn_scores, special_titles):
+    scores = {}
+    for isbn, score in isbn_scores.items():
+        if isbn in special_titles.excluded_isbns:
+            continue
+        if isbn in special_titles.replacement_isbns:
+            isbn = special_titles.final_replacement(isbn)
+            score += 1
+        scores[isbn] = max(scores.get(isbn, 0), score)
+    # Replacement ISBNs are worth warming even if no bookstore list had their bookstore ISBN yet.
+    for replacement in special_titles.replacement_isbns.values():
+        scores.setdefault(replacement, 1)
+    # sorted() is stable, so ISBNs with the same score stay in the order they were first seen.
+    return sorted(scores, key=lambda isbn: -scores[isbn])
+
+
+# Warms the catalog cache of the Textbooks folder. limit caps how many ISBNs and catkeys are looked at (the highest scored ones).
+# Returns the run report (also saved as prefetch_report.json in the Textbooks folder).
+def prefetch(textbooks_dir=TEXTBOOKS_DIR, refresh_ahead_days=7, limit=None, catalog_settings=None):
+    run_metrics = RunMetrics()
+    run_metrics.stage("scoring titles")
+    isbn_scores, catkey_scores = reuse_counts(textbooks_dir)
+    special_titles = load_special_titles(textbooks_dir)
+    isbns = isbns_to_warm(isbn_scores, special_titles)[:limit]
+    catkeys = sorted(catkey_scores, key=lambda catkey: -catkey_scores[catkey])[:limit]
+    print(str(len(isbns)) + " ISBNs and " + str(len(catkeys)) + " pull list catkeys to warm.")
+
+    catalog_client = open_catalog(textbooks_dir, refresh_ahead_days=refresh_ahead_days, **(catalog_settings or {}))
+    catalog_client.metrics = run_metrics
+    try:
+        # Searching an ISBN also warms the record of the catkey it finds. The records themselves aren't needed here, only cached, so they're dropped right away.
+        run_metrics.stage("catalog search and record fetch")
+        found = 0
+        fetched_catkeys = set()
+        for isbn, catkey, _ in catalog_client.search_and_fetch_iter(isbns, progress=Progress("Warming ISBN"), transform=lambda record: None):
+            if catkey is not None:
+                found += 1
+                fetched_catkeys.add(catkey)
+        # Then the records of pull list catkeys that none of those ISBNs led to.
+        run_metrics.stage("record fetch")
+        remaining_catkeys = [catkey for catkey in catkeys if catkey not in fetched_catkeys]
+        catalog_client.fetch_all(remaining_catkeys, progress=Progress("Warming record"))
+        run_metrics.stop()
+
+        catalog_cache = catalog_client.cache
+        print("\nCache hit rate: " + str(round(catalog_cache.hit_rate("searches")*100)) + "% of ISBN searches, "
+              + str(round(catalog_cache.hit_rate("records")*100)) + "% of item records were already fresh.")
+        return run_metrics.write_report(os.path.join(textbooks_dir, "prefetch_report.json"), cache=catalog_cache, finished=time.strftime("%Y-%m-%d %H:%M:%S"),
+                                        isbns_warmed=len(isbns), isbns_found=found, catkeys_warmed=len(remaining_catkeys), refresh_ahead_days=refresh_ahead_days)
+    finally:
+        close_catalog(catalog_client)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm up the catalog cache with the titles most likely to be on the next bookstore list.")
+    parser.add_argument("--root", default=TEXTBOOKS_DIR, help="The Textbooks folder (default: the one on the G:/ drive).")
+    parser.add_argument("--refresh-ahead-days", type=int, default=7, help="Also re-check cache entries that expire within this many days.")
+    parser.add_argument("--limit", type=int, default=None, help="Only warm this many of the most reused ISBNs (and pull list catkeys).")
+    parser.add_argument("--catalog-url", default=CATALOG_URL)
+    parser.add_argument("--max-searches", type=int, default=MAX_CATALOG_SEARCHES, help="Maximum number of catalog requests running at the same time.")
+    args = parser.parse_args()
+    prefetch(args.root, args.refresh_ahead_days, args.limit, catalog_settings={"catalog_url": args.catalog_url, "max_catalog_searches": args.max_searches})
@@ -0,0 +1,52 @@
+# This module turns the catalog's item JSON (/catalog/NCSU<catkey>.json) into pull list rows.
+# Fields are read straight out of the parsed JSON (items[].item_id, locations[].library.display, etc.), rather than by running regular expressions
+# over the text of a Python dict, so it keeps working if the catalog reorders or adds fields. Each catalog record is extracted once into a small
+# PullRecord, even if several bookstore ISBNs point to it, and PullRecord.row() gives the pull list row for it.
+
+import re
+
+# orjson parses JSON several times faster than the built-in json library. It's optional: if it isn't installed, the built-in library is used.
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    import json
+    loads = json.loads
+
+PULL_LIST_COLUMNS = ['Dept Crs-Sect', 'Catkey', 'Title', 'Author', 'Item Location', 'Call Number', 'Item Type', 'Bookstore ISBN', 'All ISBNs', 'Edition', 'Year', 'Barcodes', 'Access Restrictions']
+
+
+# Letters, digits, and whitespace only. Used to tidy up the item type and barcodes.
+def _alphanumeric(value):
+    return re.sub('[^A-Za-z0-9\\s]', '', str(value))
+
+
+# The catalog fields of one pull list row.
+class PullRecord:
+    __slots__ = ("title", "author", "location", "call_number", "item_type", "all_isbns", "edition", "year", "barcodes", "restrictions")
+
+    def __init__(self, item_json):
+        # If the catalog had no record for this catkey (204/404), every field is left blank so the pull list columns stay lined up.
+        item_json = item_json or {}
+        self.title = item_json.get("title", "")
+        self.author = item_json.get("statement_of_responsibility", "")
+        self.edition = item_json.get("edition", "")
+        self.year = item_json.get("publication_year", "")
+        self.restrictions = item_json.get("access_restrictions", "")
+        self.all_isbns = '\n'.join(item_json.get("isbn") or [])
+        # Handles multiple locations of a single catalog item: one "Library - Location" line per location.
+        self.location = ' '.join(loc.get('library', {}).get('display', '') + " - " + loc.get('location', {}).get('display', '') + " \n"
+                                 for loc in item_json.get("locations") or [])
+        self.call_number = item_json.get("call_number", "")
+        # Handles ebook vs physical titles.
+        if "ebook" in (self.call_number or ""):
+            self.item_type = "eBook"
+        else:
+            self.item_type = _alphanumeric(item_json.get("type", ""))
+        # Handles multiple barcodes for a single catalog item.
+        self.barcodes = '\n'.join(_alphanumeric(item["item_id"]) for item in item_json.get("items") or [] if item.get("item_id") is not None)
+
+    # The pull list row for this record, in PULL_LIST_COLUMNS order.
+    def row(self, dept_crs_sect, catkey, bookstore_isbn):
+        return (dept_crs_sect, catkey, self.title, self.author, self.location, self.call_number, self.item_type,
+                bookstore_isbn, self.all_isbns, self.edition, self.year, self.barcodes, self.restrictions)
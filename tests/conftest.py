@@ -0,0 +1,5 @@
+# The modules under test live in the repository folder, next to order_pull_lists.py, rather than in a package.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
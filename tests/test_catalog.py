@@ -0,0 +1,166 @@
+# CatalogClient against the mock catalog of the benchmarks (see benchmarks/mock_catalog.py), which answers like the real one but locally.
+
+import json
+
+import pytest
+
+from benchmarks.mock_catalog import MockCatalog
+from benchmarks.synthetic import catalog_has_isbn, catkey_for_isbn, synthetic_isbn
+from catalog import CatalogClient, _record_isbns
+from catalog_cache import CatalogCache
+from records import PullRecord
+from catalog_index import CatalogIndex, build_index
+
+# Synthetic ISBNs the mock catalog has, and ones it doesn't.
+OWNED = [isbn for isbn in map(synthetic_isbn, range(200)) if catalog_has_isbn(isbn)]
+NOT_OWNED = [isbn for isbn in map(synthetic_isbn, range(200)) if not catalog_has_isbn(isbn)]
+
+
+@pytest.fixture
+def mock_catalog():
+    catalog = MockCatalog()
+    catalog.start()
+    yield catalog
+    catalog.stop()
+
+
+def make_client(catalog, **options):
+    return CatalogClient(catalog.url, max_concurrency=4, backoff=0, **options)
+
+
+# An offline index built from an export that maps each ISBN to the given catkey.
+def make_index(tmp_path, catkeys_by_isbn):
+    export = tmp_path / "export.jsonl"
+    export.write_text("\n".join(json.dumps({"catkey": catkey, "isbn": [isbn]}) for isbn, catkey in catkeys_by_isbn.items()))
+    build_index([str(export)], str(tmp_path / "index"))
+    return CatalogIndex(str(tmp_path / "index"))
+
+
+def test_withdrawn_index_hit_is_searched_live(tmp_path, mock_catalog):
+    owned, not_owned = OWNED[0], NOT_OWNED[0]
+    # The export had both ISBNs on records that have been withdrawn since. The owned one is now on another record.
+    mock_catalog.missing_catkeys = {"900001", "900002"}
+    index = make_index(tmp_path, {owned: "900001", not_owned: "900002"})
+    client = make_client(mock_catalog, index=index, search_backend="json")
+    searched = []
+    results = list(client.search_and_fetch_iter([owned, not_owned], on_search=lambda isbn, catkey: searched.append((isbn, catkey))))
+    assert [(isbn, catkey) for isbn, catkey, _ in results] == [(owned, catkey_for_isbn(owned)), (not_owned, None)]
+    assert results[0][2]["isbn"] == ["979" + catkey_for_isbn(owned).zfill(9)]
+    assert results[1][2] is None
+    assert client.index_hits == 0
+    assert sorted(searched) == sorted([(owned, catkey_for_isbn(owned)), (not_owned, None)])
+
+
+def test_current_index_hit_is_not_searched(tmp_path, mock_catalog):
+    owned = OWNED[0]
+    index = make_index(tmp_path, {owned: catkey_for_isbn(owned)})
+    client = make_client(mock_catalog, index=index, search_backend="json")
+    requests_before = mock_catalog.requests
+    assert [(isbn, catkey) for isbn, catkey, _ in client.search_and_fetch_iter([owned])] == [(owned, catkey_for_isbn(owned))]
+    assert client.index_hits == 1
+    # Only the record fetch went to the catalog.
+    assert mock_catalog.requests - requests_before == 1
+
+
+@pytest.mark.parametrize("doc", [
+    # JSON:API style, with the values wrapped in {"attributes": {"value": ...}}
+    {"id": "NCSU123", "attributes": {"isbn_ssim": {"attributes": {"value": ["9780306406157", "080442957X"]}}}},
+    # JSON:API style, plain values
+    {"id": "NCSU123", "attributes": {"isbn_t": ["9780306406157", "080442957X"]}},
+    # Solr style, with qualifiers after the ISBNs and an ISBN-10
+    {"id": "NCSU123", "isbn": ["0306406152 (pbk.)", "9780804429573 (hardcover)"]},
+])
+def test_record_isbns_gives_canonical_keys(doc):
+    assert sorted(_record_isbns(doc)) == ["9780306406157", "9780804429573"]
+
+
+def test_record_isbns_skips_other_fields_and_blanks():
+    doc = {"id": "NCSU123", "title": "9780306406157", "attributes": {"isbn_t": "", "isbn_ssim": {"attributes": {"value": "9780804429573"}}}}
+    assert _record_isbns(doc) == ["9780804429573"]
+
+
+def test_json_search_maps_record_isbns_back_to_the_isbns_asked_for(mock_catalog):
+    client = make_client(mock_catalog, search_backend="json")
+
+    def respond(path):
+        # The ISBN-10 form of the first ISBN is on the first record, and the second record lists it as well: the higher-ranked record wins.
+        docs = [{"id": "NCSU111", "attributes": {"isbn_t": ["0306406152", "9781111111111"]}},
+                {"id": "NCSU222", "attributes": {"isbn_t": ["9780306406157", "9780804429573"]}}]
+        return 200, "application/json", json.dumps({"data": docs, "meta": {"pages": {"total_count": 2}}})
+    mock_catalog.respond = respond
+    found, complete = client._json_search(["9780306406157", "9780804429573", "9780000000002"])
+    assert found == {"9780306406157": "111", "9780804429573": "222"}
+    assert complete
+
+
+def test_capped_page_falls_back_to_html_search(mock_catalog):
+    # The catalog only returns 20 records per page, even though the client asks for 50. Every owned ISBN must still be found.
+    mock_catalog.max_per_page = 20
+    client = make_client(mock_catalog, search_backend="json", batch_size=25)
+    isbns = OWNED[:25] + NOT_OWNED[:5]
+    results = client.search_many(isbns)
+    assert results == {**{isbn: catkey_for_isbn(isbn) for isbn in OWNED[:25]}, **{isbn: None for isbn in NOT_OWNED[:5]}}
+
+
+def test_full_results_do_not_fall_back(mock_catalog):
+    client = make_client(mock_catalog, search_backend="json", batch_size=25)
+    isbns = OWNED[:20] + NOT_OWNED[:5]
+    found, complete = client._json_search(isbns)
+    assert complete
+    assert found == {isbn: catkey_for_isbn(isbn) for isbn in OWNED[:20]}
+    requests_before = mock_catalog.requests
+    assert client.search_many(isbns) == {isbn: found.get(isbn) for isbn in isbns}
+    assert mock_catalog.requests - requests_before == 1
+
+
+def test_total_count_from_either_response_style(mock_catalog):
+    client = make_client(mock_catalog, search_backend="json")
+    # Solr style: 2 of 3 matches returned, so the missing ISBN can't be trusted as "not found".
+    page = {"response": {"numFound": 3, "docs": [{"id": "NCSU1", "isbn": ["9780306406157"]}, {"id": "NCSU2", "isbn": ["9780804429573"]}]}}
+    mock_catalog.respond = lambda path: (200, "application/json", json.dumps(page))
+    assert client._json_search(["9780306406157", "9780804429573", "9780000000002"])[1] is False
+    page["response"]["numFound"] = 2
+    assert client._json_search(["9780306406157", "9780804429573", "9780000000002"])[1] is True
+
+
+def test_stopping_early_cancels_the_remaining_searches(mock_catalog):
+    # The caller fails partway through (like an error writing a pull list row): the rest of the list must not be searched first.
+    mock_catalog.latency_ms = 20
+    client = make_client(mock_catalog, search_backend="html")
+    isbns = [synthetic_isbn(i) for i in range(200)]
+    with pytest.raises(RuntimeError):
+        for position, _ in enumerate(client.search_and_fetch_iter(isbns)):
+            if position == 3:
+                raise RuntimeError("write failed")
+    # At most the requests that were already running finish (a few per worker thread), far from the 200+ of the whole list.
+    assert mock_catalog.requests < 40
+
+
+def test_withdrawn_record_of_a_cached_search_is_searched_live(tmp_path, mock_catalog):
+    owned, not_owned = OWNED[0], NOT_OWNED[0]
+    cache = CatalogCache(str(tmp_path / "cache.sqlite"))
+    # Searches cached by an earlier run, whose records have been withdrawn since.
+    cache.put("searches", owned, "900001")
+    cache.put("searches", not_owned, "900002")
+    mock_catalog.missing_catkeys = {"900001", "900002"}
+    client = make_client(mock_catalog, cache=cache, search_backend="json")
+    results = list(client.search_and_fetch_iter([owned, not_owned], transform=PullRecord))
+    assert [(isbn, catkey) for isbn, catkey, _ in results] == [(owned, catkey_for_isbn(owned)), (not_owned, None)]
+    assert results[0][2].title == "Synthetic Title " + catkey_for_isbn(owned)
+    assert results[1][2] is None
+    # The cache now has what the live search found.
+    assert cache.get("searches", owned).value == catkey_for_isbn(owned)
+    assert cache.get("searches", not_owned).value is None
+    cache.close()
+
+
+def test_withdrawn_record_of_a_checkpointed_search_is_never_a_blank_row(mock_catalog):
+    owned = OWNED[0]
+    # An interrupted run found a catkey whose record is gone, and the live search still lists that same record.
+    mock_catalog.missing_catkeys = {catkey_for_isbn(owned)}
+    client = make_client(mock_catalog, search_backend="html")
+    searched = []
+    results = list(client.search_and_fetch_iter([owned, owned], known={owned: catkey_for_isbn(owned)}, transform=PullRecord,
+                                                on_search=lambda isbn, catkey: searched.append((isbn, catkey))))
+    assert results == [(owned, None, None), (owned, None, None)]
+    assert searched == [(owned, None)]
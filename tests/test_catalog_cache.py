@@ -0,0 +1,95 @@
+# CatalogCache (see catalog_cache.py): how long entries are trusted, revalidation with a 304, and which entries are evicted.
+
+import pytest
+
+from benchmarks.mock_catalog import MockCatalog
+from benchmarks.synthetic import catalog_has_isbn, catkey_for_isbn, synthetic_isbn
+from catalog import CatalogClient
+from catalog_cache import DAY, CatalogCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = CatalogCache(str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+# Make an entry look like it was fetched (and last used) days_ago days ago.
+def age(cache, kind, key, days_ago):
+    then = cache._conn.execute("SELECT fetched_at FROM " + kind + " WHERE " + cache._key_column(kind) + " = ?", (key,)).fetchone()[0] - days_ago * DAY
+    cache._conn.execute("UPDATE " + kind + " SET fetched_at = ?, last_used = ? WHERE " + cache._key_column(kind) + " = ?", (then, then, key))
+    cache._conn.commit()
+
+
+def test_found_entries_expire_after_ttl(cache):
+    cache.put("searches", "9780306406157", "111", etag='"v1"')
+    assert cache.get("searches", "9780306406157").fresh
+    age(cache, "searches", "9780306406157", 29)
+    assert cache.get("searches", "9780306406157").fresh
+    age(cache, "searches", "9780306406157", 2)
+    entry = cache.get("searches", "9780306406157")
+    # A stale entry keeps its value and validators, for the conditional GET.
+    assert (entry.value, entry.fresh, entry.revalidation_headers()) == ("111", False, {"If-None-Match": '"v1"'})
+    assert cache.get("searches", "9780000000002") is None
+
+
+def test_not_found_entries_expire_sooner(cache):
+    cache.put("searches", "9780306406157", None)
+    cache.put("searches", "9780804429573", "111")
+    age(cache, "searches", "9780306406157", 4)
+    age(cache, "searches", "9780804429573", 4)
+    assert not cache.get("searches", "9780306406157").fresh
+    assert cache.get("searches", "9780804429573").fresh
+
+
+def test_refresh_ahead_makes_entries_stale_early(tmp_path):
+    cache = CatalogCache(str(tmp_path / "cache.sqlite"), refresh_ahead_days=7)
+    cache.put("records", "111", "{}")
+    age(cache, "records", "111", 24)
+    assert not cache.get("records", "111").fresh
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = CatalogCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for days_ago, catkey in enumerate(["111", "222", "333"]):
+        cache.put("records", catkey, "{}")
+        age(cache, "records", catkey, 10 - days_ago)
+    # "111" is the oldest entry, but it was just read. The read is only buffered until evict() saves it.
+    cache.get("records", "111")
+    cache.evict()
+    assert cache.get("records", "222") is None
+    assert cache.get("records", "111") is not None and cache.get("records", "333") is not None
+    cache.close()
+
+
+def test_stale_entry_is_revalidated_with_304(tmp_path, monkeypatch):
+    isbn = next(isbn for isbn in map(synthetic_isbn, range(200)) if catalog_has_isbn(isbn))
+    catalog = MockCatalog().start()
+    cache = CatalogCache(str(tmp_path / "cache.sqlite"))
+    client = CatalogClient(catalog.url, max_concurrency=4, backoff=0, cache=cache)
+    sent_headers = []
+    real_get = client.get
+
+    def get(url, headers=None, **kwargs):
+        sent_headers.append(headers)
+        return real_get(url, headers=headers, **kwargs)
+    monkeypatch.setattr(client, "get", get)
+    try:
+        cache.put("searches", isbn, catkey_for_isbn(isbn), etag='"v1"', last_modified="Mon, 02 Oct 2023 00:00:00 GMT")
+        age(cache, "searches", isbn, 31)
+        # The catalog says nothing changed, so the cached catkey is used and its TTL restarts.
+        monkeypatch.setattr(catalog, "respond", lambda path: (304, "text/plain", ""))
+        assert client.search(isbn) == catkey_for_isbn(isbn)
+        assert sent_headers == [{"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 02 Oct 2023 00:00:00 GMT"}]
+        assert cache.stats["searches"] == {"hit": 0, "revalidated": 1, "miss": 0}
+        assert cache.get("searches", isbn).fresh
+        # Fresh again, so the next search doesn't go to the catalog at all.
+        requests_before = catalog.requests
+        assert client.search(isbn) == catkey_for_isbn(isbn)
+        assert catalog.requests == requests_before
+        assert cache.hit_rate("searches") == 1.0
+    finally:
+        catalog.stop()
+        cache.close()
@@ -0,0 +1,23 @@
+# The offline index (see catalog_index.py), built from small JSON lines exports.
+
+import json
+
+from catalog_index import CatalogIndex, build_index
+
+
+def write_export(path, records):
+    path.write_text("\n".join(json.dumps(record) for record in records))
+    return str(path)
+
+
+def test_jsonl_export_is_indexed_by_canonical_isbn(tmp_path):
+    export = write_export(tmp_path / "export.jsonl", [
+        {"id": "NCSU111", "isbn": ["0306406152 (v. 1)", "9780804429573 (pbk.)"]},
+        {"catkey": "222", "isbn": "9781111111113"},
+        # The first record in the export wins for an ISBN that is on more than one.
+        {"catkey": "333", "isbn": ["978-0-306-40615-7"]},
+    ])
+    assert build_index([export], str(tmp_path / "index")) == 3
+    index = CatalogIndex(str(tmp_path / "index"))
+    assert index.lookup(["9780306406157", "9780804429573", "9781111111113", "9780000000002", ""]) == {
+        "9780306406157": "111", "9780804429573": "111", "9781111111113": "222"}
@@ -0,0 +1,41 @@
+# SearchCheckpoint (see checkpoint.py): resuming an interrupted run's catalog searches.
+
+from checkpoint import SearchCheckpoint
+
+
+def test_resume_returns_saved_results(tmp_path):
+    path = str(tmp_path / "search_checkpoint FallBookstoreList 9-8-2023.jsonl")
+    assert SearchCheckpoint(path).load() == {}
+    checkpoint = SearchCheckpoint(path)
+    checkpoint.record("9780306406157", "111")
+    checkpoint.record("9780804429573", None)
+    # The run was interrupted here. The next one picks up both results, and its own are added to the same file.
+    resumed = SearchCheckpoint(path)
+    assert resumed.load() == {"9780306406157": "111", "9780804429573": None}
+    resumed.record("9781111111113", "333")
+    resumed.record("9780306406157", "444")
+    resumed.close()
+    # The latest result for an ISBN wins.
+    assert SearchCheckpoint(path).load() == {"9780306406157": "444", "9780804429573": None, "9781111111113": "333"}
+    checkpoint.close()
+
+
+def test_resume_after_truncated_last_line(tmp_path):
+    path = tmp_path / "search_checkpoint.jsonl"
+    # Killed while writing the second line.
+    path.write_text('{"isbn": "9780306406157", "catkey": "111"}\n{"isbn": "97808044', encoding="utf-8")
+    resumed = SearchCheckpoint(str(path))
+    assert resumed.load() == {"9780306406157": "111"}
+    resumed.record("9780804429573", "222")
+    resumed.close()
+    assert SearchCheckpoint(str(path)).load() == {"9780306406157": "111", "9780804429573": "222"}
+
+
+def test_remove_deletes_the_checkpoint(tmp_path):
+    path = str(tmp_path / "search_checkpoint.jsonl")
+    checkpoint = SearchCheckpoint(path)
+    checkpoint.record("9780306406157", "111")
+    checkpoint.remove()
+    assert SearchCheckpoint(path).load() == {}
+    # Removing a checkpoint that was never written is fine too.
+    SearchCheckpoint(path).remove()
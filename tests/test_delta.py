@@ -0,0 +1,44 @@
+# Delta snapshots (see delta.py): which rows changed, and which earlier bookstore list a list is compared with.
+
+import pandas as pd
+
+from delta import changed_isbns, previous_snapshot, save_snapshot, snapshot_path
+
+COLUMNS = ["Dept", "Crs", "Title", "ISBN-13"]
+
+
+def bookstore_list(*rows):
+    return pd.DataFrame([dict(zip(COLUMNS + ["ISBN Key"], row + (row[-1],))) for row in rows])
+
+
+def test_changed_isbns_finds_added_and_changed_rows(tmp_path):
+    path = str(tmp_path / "bookstore_snapshot FallBookstoreList 8-1-2023.csv")
+    save_snapshot(bookstore_list(("HI", "101", "History", "9780306406157"),
+                                 ("MA", "141", "Calculus", "9780804429573"),
+                                 ("EN", "101", "Writing", "9781111111113")), COLUMNS, path)
+    new_list = bookstore_list(("HI", "101", "History", "9780306406157"),
+                              # Same ISBN, new section: only this row is new, but its ISBN has to be looked at again.
+                              ("MA", "241", "Calculus", "9780804429573"),
+                              ("CH", "101", "Chemistry", "9780000000002"))
+    assert changed_isbns(new_list, COLUMNS, path) == {"9780804429573", "9780000000002"}
+    # Rows dropped from the new list don't count as changes.
+    assert changed_isbns(new_list.iloc[:1], COLUMNS, path) == set()
+
+
+def test_previous_snapshot_is_the_latest_earlier_list(tmp_path):
+    sem_dir = str(tmp_path)
+    for name in ["FallBookstoreList 8-1-2023", "FallBookstoreList 8-15-2023", "FallBookstoreList 9-8-2023", "FallBookstoreList 10-2-2023"]:
+        open(snapshot_path(sem_dir, name), "w").close()
+    # The old single snapshot file doesn't say which list it came from, so it's never used.
+    open(str(tmp_path / "bookstore_snapshot.csv"), "w").close()
+    assert previous_snapshot(sem_dir, "FallBookstoreList 9-8-2023") == (
+        "FallBookstoreList 8-15-2023", snapshot_path(sem_dir, "FallBookstoreList 8-15-2023"))
+    assert previous_snapshot(sem_dir, "FallBookstoreList 12-1-2023")[0] == "FallBookstoreList 10-2-2023"
+
+
+def test_previous_snapshot_never_uses_the_lists_own_snapshot(tmp_path):
+    sem_dir = str(tmp_path)
+    open(snapshot_path(sem_dir, "FallBookstoreList 9-8-2023"), "w").close()
+    assert previous_snapshot(sem_dir, "FallBookstoreList 9-8-2023") is None
+    assert previous_snapshot(sem_dir, "FallBookstoreList 8-1-2023") is None
+    assert previous_snapshot(sem_dir, "FallBookstoreList") is None
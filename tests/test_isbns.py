@@ -0,0 +1,68 @@
+# Every ISBN comparison in the pipeline goes through canonical_isbn (see isbns.py), so these pin down how each way an ISBN can show up
+# in our spreadsheets is turned into a key.
+
+import pandas as pd
+import pytest
+
+from isbns import canonical_isbn, canonical_isbns, isbn10_is_valid, isbn10_to_isbn13, isbn13_is_valid
+
+ISBN13 = "9780306406157"
+
+
+@pytest.mark.parametrize("value", [
+    9780306406157,              # int, as the bookstore list stores it
+    9780306406157.0,            # float, from a column pandas read with blanks in it
+    "9780306406157",            # string, as SpecialTitles is read
+    "9780306406157.0",          # a float that was turned into text
+    " 9780306406157 ",
+    "978-0-306-40615-7",
+])
+def test_isbn13_in_any_form_gives_the_same_key(value):
+    assert canonical_isbn(value) == ISBN13
+
+
+@pytest.mark.parametrize("value", [
+    "0306406152",
+    "0-306-40615-2",
+    306406152,                  # an ISBN-10 that lost its leading zero
+    306406152.0,
+])
+def test_isbn10_is_converted_to_its_isbn13(value):
+    assert canonical_isbn(value) == ISBN13
+
+
+def test_isbn10_with_x_check_digit():
+    assert canonical_isbn("080442957X") == "9780804429573"
+    assert canonical_isbn("080442957x") == "9780804429573"
+
+
+@pytest.mark.parametrize("value", [None, float("nan"), "", "   ", 0, 0.0, "0", "0000000000"])
+def test_blank_and_zero_become_empty(value):
+    assert canonical_isbn(value) == ""
+
+
+def test_invalid_isbn10_is_kept_as_its_digits():
+    # A bad check digit isn't converted, but still matches itself however it was stored.
+    assert canonical_isbn("0306406153") == "0306406153"
+    assert canonical_isbn(306406153) == "0306406153"
+
+
+def test_invalid_isbn13_is_kept():
+    assert canonical_isbn("9780306406158") == "9780306406158"
+    assert not isbn13_is_valid("9780306406158")
+
+
+def test_check_digits():
+    assert isbn13_is_valid(ISBN13)
+    assert not isbn13_is_valid("978030640615")
+    assert isbn10_is_valid("0306406152")
+    assert isbn10_is_valid("080442957X")
+    assert not isbn10_is_valid("0306406153")
+    assert isbn10_to_isbn13("0306406152") == ISBN13
+
+
+def test_canonical_isbns_of_a_column_with_blanks():
+    # pandas reads an int column with a blank cell as floats, with NaN for the blank.
+    column = pd.Series([9780306406157, None, 306406152])
+    assert column.dtype == float
+    assert canonical_isbns(column) == [ISBN13, "", ISBN13]
@@ -0,0 +1,61 @@
+# ListLedger (see ledger.py): which previous order and pull lists are read again, and which ISBNs they contribute.
+
+import os
+
+import pandas as pd
+
+from ledger import ListLedger
+
+
+def write_list(path, sheet, column, isbns):
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({column: isbns}).to_excel(writer, sheet_name=sheet, index=False)
+    return str(path)
+
+
+def test_only_new_or_changed_workbooks_are_read(tmp_path):
+    order = write_list(tmp_path / "order_list 9-1-2023.xlsx", "Order List", "ISBN-13", ["9780306406157", "0-8044-2957-X"])
+    pull = write_list(tmp_path / "pull_list 9-1-2023.xlsx", "Pull List", "Bookstore ISBN", ["9781111111113"])
+    ledger = ListLedger(str(tmp_path / "previous_lists_ledger.sqlite"))
+    assert sorted(ledger.sync({"order": [order], "pull": [pull]})) == ["order_list 9-1-2023.xlsx", "pull_list 9-1-2023.xlsx"]
+    assert ledger.isbns("order") == {"9780306406157", "9780804429573"}
+    assert ledger.isbns("pull") == {"9781111111113"}
+    assert ledger.sync({"order": [order], "pull": [pull]}) == []
+    ledger.close()
+
+    # Opened again (the next run): nothing changed, so nothing is read.
+    ledger = ListLedger(str(tmp_path / "previous_lists_ledger.sqlite"))
+    assert ledger.sync({"order": [order], "pull": [pull]}) == []
+    assert ledger.isbns("order") == {"9780306406157", "9780804429573"}
+
+    # Touched, but the same contents: the hash says there is nothing to read.
+    stat = os.stat(order)
+    os.utime(order, (stat.st_atime, stat.st_mtime + 60))
+    assert ledger.sync({"order": [order], "pull": [pull]}) == []
+    # The new modification time was saved, so the hash isn't computed again either.
+    assert ledger._conn.execute("SELECT mtime FROM files WHERE name = ?", ("order_list 9-1-2023.xlsx",)).fetchone()[0] == stat.st_mtime + 60
+    ledger.close()
+
+
+def test_edited_workbook_is_read_again(tmp_path):
+    order = write_list(tmp_path / "order_list 9-1-2023.xlsx", "Order List", "ISBN-13", ["9780306406157", "9780804429573"])
+    ledger = ListLedger(str(tmp_path / "previous_lists_ledger.sqlite"))
+    ledger.sync({"order": [order]})
+    stat = os.stat(order)
+    write_list(tmp_path / "order_list 9-1-2023.xlsx", "Order List", "ISBN-13", ["9780306406157", "9781111111113"])
+    os.utime(order, (stat.st_atime, stat.st_mtime + 60))
+    assert ledger.sync({"order": [order]}) == ["order_list 9-1-2023.xlsx"]
+    # The ISBN taken off the list is no longer excluded.
+    assert ledger.isbns("order") == {"9780306406157", "9781111111113"}
+    ledger.close()
+
+
+def test_deleted_workbook_is_dropped(tmp_path):
+    old = write_list(tmp_path / "order_list 8-1-2023.xlsx", "Order List", "ISBN-13", ["9780306406157"])
+    new = write_list(tmp_path / "order_list 9-1-2023.xlsx", "Order List", "ISBN-13", ["9780804429573"])
+    ledger = ListLedger(str(tmp_path / "previous_lists_ledger.sqlite"))
+    ledger.sync({"order": [old, new]})
+    os.remove(old)
+    assert ledger.sync({"order": [new], "pull": []}) == []
+    assert ledger.isbns("order") == {"9780804429573"}
+    ledger.close()
@@ -0,0 +1,125 @@
+# This module loads the sheets we need out of Excel workbooks (the bookstore list, SpecialTitles, and previous order/pull lists).
+# Each workbook is opened once, no matter how many sheets we need from it, and only the columns the script actually uses are parsed.
+# If python-calamine is installed, it's used to read the workbooks (it's much faster than openpyxl); otherwise pandas' default reader is used.
+# If pyarrow is installed, each parsed sheet is also saved as a Parquet "sidecar" file named after the workbook's SHA-1 hash,
+# so running the script again on the same bookstore list skips parsing the Excel file completely.
+# Sidecars are named after the workbook's path too. Once a workbook changes, the sidecars of its old contents are deleted, and the folder as a whole
+# is kept under MAX_SIDECAR_BYTES by deleting the least recently used sidecars first.
+
+import hashlib          # Used to fingerprint workbooks, so a sidecar is only reused for exactly the same file contents.
+import importlib.util
+import os
+
+import pandas as pd
+
+# Size limit of the sidecar folder. Bookstore lists, SpecialTitles, and (through the prefetch job) the lists of every old semester all get sidecars.
+MAX_SIDECAR_BYTES = 500 * 1024 * 1024
+
+
+def excel_engine():
+    if importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+    return None
+
+
+def parquet_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+# Identifies a workbook by its location, so the sidecars of its older versions can be found once it changes.
+def _workbook_key(path):
+    return hashlib.sha1(os.path.normcase(os.path.abspath(path)).encode()).hexdigest()[:12]
+
+
+# Builds the name of the sidecar for one sheet of one workbook: "<workbook key>-<SHA-1 of its contents>-<options>.parquet".
+# The columns and dtype are part of the name, since they change what gets parsed.
+def _sidecar_path(sidecar_dir, workbook_key, workbook_sha1, sheet, columns, dtype):
+    options = repr((sheet, None if columns is None else sorted(columns), dtype))
+    return os.path.join(sidecar_dir, workbook_key + "-" + workbook_sha1 + "-" + hashlib.sha1(options.encode()).hexdigest()[:12] + ".parquet")
+
+
+# Read several sheets out of one workbook. sheets maps each sheet name to the list of columns to keep (None keeps all of them).
+# Columns that aren't in the sheet are skipped rather than raising an error, so older workbooks with fewer columns still load.
+# dtype is passed on to pandas (dtype=str keeps ISBNs with leading zeros intact). Missing cells are left as NaN; the caller decides what to fill them with.
+# If sidecar_dir is given (and pyarrow is available), parsed sheets are saved there and reused on the next run.
+# Returns a dict of sheet name -> dataframe.
+def read_sheets(path, sheets, dtype=None, sidecar_dir=None):
+    use_sidecars = sidecar_dir is not None and parquet_available()
+    workbook_key = _workbook_key(path) if use_sidecars else None
+    workbook_sha1 = file_hash(path) if use_sidecars else None
+    frames = {}
+    to_parse = []
+    for sheet, columns in sheets.items():
+        if use_sidecars:
+            sidecar = _sidecar_path(sidecar_dir, workbook_key, workbook_sha1, sheet, columns, dtype)
+            try:
+                frames[sheet] = pd.read_parquet(sidecar)
+                # The modification time marks when a sidecar was last used, which is what prune_sidecars goes by.
+                os.utime(sidecar)
+                continue
+            except OSError:
+                # No sidecar yet (or another process just pruned it), so the sheet gets parsed.
+                pass
+        to_parse.append(sheet)
+
+    if to_parse:
+        with pd.ExcelFile(path, engine=excel_engine()) as workbook:
+            for sheet in to_parse:
+                columns = sheets[sheet]
+                usecols = None if columns is None else (lambda column, columns=set(columns): column in columns)
+                frames[sheet] = workbook.parse(sheet, usecols=usecols, dtype=dtype)
+                if use_sidecars:
+                    _save_sidecar(frames[sheet], _sidecar_path(sidecar_dir, workbook_key, workbook_sha1, sheet, columns, dtype))
+        if use_sidecars:
+            prune_sidecars(sidecar_dir, workbook_key, workbook_sha1)
+    return {sheet: frames[sheet] for sheet in sheets}
+
+
+# Deletes sidecars that won't be used again: the ones of workbook_key's older contents (anything not named after workbook_sha1),
+# then the least recently used ones until the folder is under max_bytes. Sidecars another process is still using are skipped.
+def prune_sidecars(sidecar_dir, workbook_key=None, workbook_sha1=None, max_bytes=MAX_SIDECAR_BYTES):
+    sidecars = []
+    for entry in os.scandir(sidecar_dir):
+        if not entry.name.endswith(".parquet"):
+            continue
+        try:
+            if workbook_key is not None and entry.name.startswith(workbook_key + "-") and not entry.name.startswith(workbook_key + "-" + workbook_sha1 + "-"):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+        except OSError:
+            continue
+        sidecars.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in sidecars)
+    for _, size, sidecar in sorted(sidecars):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(sidecar)
+        except OSError:
+            continue
+        total -= size
+
+
+def _save_sidecar(df, sidecar):
+    os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+    # Write to a temporary file first, so an interrupted run never leaves half a sidecar behind. The temporary name is per process,
+    # since the worker processes of a batch (see run_batch in order_pull_lists.py) can be saving the same sidecar at the same time.
+    temp = sidecar + "." + str(os.getpid()) + ".tmp"
+    try:
+        df.to_parquet(temp, index=False)
+    except (ValueError, TypeError, ImportError) as error:
+        # Some sheets can't be stored as Parquet (for example, a column mixing numbers and text). Those just get parsed from Excel every time.
+        print("Note: could not cache sheet as Parquet (" + str(error) + ").")
+        if os.path.exists(temp):
+            os.remove(temp)
+        return
+    os.replace(temp, sidecar)
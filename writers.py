@@ -0,0 +1,137 @@
+# This module writes the order list and pull list workbooks one row at a time, instead of building a whole dataframe first and calling to_excel.
+# The workbook is opened in xlsxwriter's constant_memory mode, which flushes each row to disk as soon as the next one starts, so memory use stays flat
+# no matter how long the lists get. The sheets look the same as before: same column widths, text wrapping and top alignment on every column,
+# and the same bold, bordered header row that pandas writes.
+# Each sheet can optionally also be copied to CSV and/or Parquet files in the same pass (for loading the lists somewhere else).
+
+import csv
+import glob
+import importlib.util
+import os
+import math
+
+import numpy as np
+import xlsxwriter
+
+HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+CELL_FORMAT = {'text_wrap': True, 'valign': 'top'}
+
+# How many rows are collected before they're written to a Parquet copy.
+PARQUET_BATCH_ROWS = 5000
+
+
+# Turns a value into what to_excel would have written: blanks (NaN/None) become na_rep, numpy numbers become plain Python numbers, anything else becomes text.
+def cell_value(value, na_rep='Nan'):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return na_rep
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    return str(value)
+
+
+class SheetWriter:
+    def __init__(self, workbook, name, columns, widths, cell_format, header_format, csv_path=None, parquet_path=None):
+        self.worksheet = workbook.add_worksheet(name)
+        self.columns = columns
+        self.rows = 0
+        for column_range, width in widths:
+            self.worksheet.set_column(column_range, width, cell_format=cell_format)
+        for col, column in enumerate(columns):
+            self.worksheet.write_string(0, col, column, header_format)
+        # Optional copies of the sheet.
+        self._csv_file = None
+        if csv_path is not None:
+            self._csv_file = open(csv_path, "w", newline="", encoding="utf-8-sig")
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(columns)
+        self._parquet_path = parquet_path
+        self._parquet_writer = None
+        self._parquet_rows = []
+
+    def write_row(self, values):
+        self.rows += 1
+        for col, value in enumerate(values):
+            value = cell_value(value)
+            # Data cells are written without a format of their own, so they pick up the column's wrap/alignment format.
+            if isinstance(value, str):
+                self.worksheet.write_string(self.rows, col, value)
+            else:
+                self.worksheet.write(self.rows, col, value)
+        # The copies leave blank cells blank instead of writing na_rep.
+        if self._csv_file is not None:
+            self._csv.writerow([cell_value(value, na_rep="") for value in values])
+        if self._parquet_path is not None:
+            self._parquet_rows.append([str(cell_value(value, na_rep="")) for value in values])
+            if len(self._parquet_rows) >= PARQUET_BATCH_ROWS:
+                self._flush_parquet()
+
+    def write_rows(self, rows):
+        for values in rows:
+            self.write_row(values)
+
+    def _flush_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({column: [row[i] for row in self._parquet_rows] for i, column in enumerate(self.columns)},
+                         schema=pa.schema([(column, pa.string()) for column in self.columns]))
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self._parquet_path, table.schema)
+        self._parquet_writer.write_table(table)
+        self._parquet_rows = []
+
+    def close(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+        if self._parquet_path is not None:
+            if self._parquet_rows or self._parquet_writer is None:
+                self._flush_parquet()
+            self._parquet_writer.close()
+
+
+# A workbook written row by row. Use it with "with", and add one sheet at a time: in constant_memory mode, rows have to be written in order.
+# copy_formats can hold "csv" and/or "parquet" to also write "<workbook name> - <sheet name>.csv/.parquet" next to the workbook.
+# Copies left over from an earlier version of the workbook are deleted when it's rewritten, so they never disagree with it.
+class StreamingWorkbook:
+    def __init__(self, path, copy_formats=()):
+        self.path = path
+        self.copy_formats = set(copy_formats)
+        if "parquet" in self.copy_formats and importlib.util.find_spec("pyarrow") is None:
+            print("Note: pyarrow isn't installed, so no Parquet copies will be written.")
+            self.copy_formats.discard("parquet")
+        base = glob.escape(path[:-len(".xlsx")] if path.endswith(".xlsx") else path)
+        for old_copy in glob.glob(base + " - *.csv") + glob.glob(base + " - *.parquet"):
+            os.remove(old_copy)
+        self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        self.cell_format = self.workbook.add_format(CELL_FORMAT)
+        self.header_format = self.workbook.add_format(HEADER_FORMAT)
+        self.sheets = []
+
+    # widths is a list of (column range, width) pairs, e.g. [('A:A', 5), ('B:B', 15)].
+    def add_sheet(self, name, columns, widths):
+        base = self.path[:-len(".xlsx")] if self.path.endswith(".xlsx") else self.path
+        sheet = SheetWriter(self.workbook, name, list(columns), widths, self.cell_format, self.header_format,
+                            csv_path=base + " - " + name + ".csv" if "csv" in self.copy_formats else None,
+                            parquet_path=base + " - " + name + ".parquet" if "parquet" in self.copy_formats else None)
+        self.sheets.append(sheet)
+        return sheet
+
+    # Writes a whole dataframe (or anything with .columns and .itertuples) as one sheet.
+    def add_frame(self, name, df, widths):
+        sheet = self.add_sheet(name, df.columns, widths)
+        sheet.write_rows(df.itertuples(index=False, name=None))
+        return sheet
+
+    def close(self):
+        for sheet in self.sheets:
+            sheet.close()
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()